@@ -0,0 +1,176 @@
+/**
+ * Compact set of chunk indexes, one bit per chunk. Tracking a file with
+ * millions of chunks costs ~1 byte per 8 chunks instead of a Set entry each.
+ * Supports the Set methods upload code relies on (has, add, size, iteration).
+ */
+class ChunkBitmap {
+  /**
+   * @param {number} [capacity] - Expected number of chunks; the bitmap is
+   *   sized for them up front, and still grows if more are added
+   */
+  constructor(capacity = 0) {
+    this.words = new Uint32Array(Math.ceil(capacity / 32));
+    this.count = 0;
+  }
+
+  /**
+   * Build a bitmap from half-open [start, end) ranges, as returned by
+   * GET /upload/status with Accept: application/vnd.indexcp.ranges+json
+   * @param {Array<[number, number]>} ranges
+   * @returns {ChunkBitmap}
+   */
+  static fromRanges(ranges) {
+    const bitmap = new ChunkBitmap();
+    for (const [start, end] of ranges) {
+      bitmap.addRange(start, end);
+    }
+    return bitmap;
+  }
+
+  get size() {
+    return this.count;
+  }
+
+  has(index) {
+    const word = index >>> 5;
+    return word < this.words.length && (this.words[word] & (1 << (index & 31))) !== 0;
+  }
+
+  add(index) {
+    const word = index >>> 5;
+    this.ensureWords(word + 1);
+    const bit = 1 << (index & 31);
+    if ((this.words[word] & bit) === 0) {
+      this.words[word] |= bit;
+      this.count++;
+    }
+    return this;
+  }
+
+  /**
+   * Set every index in [start, end), a whole word at a time where possible
+   */
+  addRange(start, end) {
+    if (end <= start) {
+      return this;
+    }
+    this.ensureWords(((end - 1) >>> 5) + 1);
+    for (let index = start; index < end;) {
+      const word = index >>> 5;
+      const from = index & 31;
+      const to = Math.min(32, from + (end - index));
+      // Bits [from, to) of this word
+      const mask = to - from === 32 ? 0xFFFFFFFF : ((1 << (to - from)) - 1) << from;
+      const added = mask & ~this.words[word];
+      this.words[word] |= mask;
+      this.count += popcount(added);
+      index += to - from;
+    }
+    return this;
+  }
+
+  ensureWords(length) {
+    if (length > this.words.length) {
+      // Grow geometrically so sequential adds stay amortized O(1)
+      const grown = new Uint32Array(Math.max(length, this.words.length * 2));
+      grown.set(this.words);
+      this.words = grown;
+    }
+  }
+
+  /**
+   * Set indexes in ascending order
+   */
+  *[Symbol.iterator]() {
+    for (let word = 0; word < this.words.length; word++) {
+      let bits = this.words[word];
+      while (bits !== 0) {
+        const low = bits & -bits;
+        yield word * 32 + (31 - Math.clz32(low));
+        bits ^= low;
+      }
+    }
+  }
+
+  /**
+   * Whether both bitmaps hold the same indexes, compared 32 at a time.
+   * Capacity does not matter: words past the end of the shorter one must be 0.
+   * @param {ChunkBitmap} other
+   * @returns {boolean}
+   */
+  equals(other) {
+    if (this.count !== other.count) {
+      return false;
+    }
+    const [shorter, longer] = this.words.length <= other.words.length
+      ? [this.words, other.words]
+      : [other.words, this.words];
+    for (let word = 0; word < longer.length; word++) {
+      if ((word < shorter.length ? shorter[word] : 0) !== longer[word]) {
+        return false;
+      }
+    }
+    return true;
+  }
+
+  /**
+   * Indexes in [0, total) that are not set, in ascending order. Words with
+   * every bit set are skipped whole, so a mostly complete upload costs one
+   * comparison per 32 chunks.
+   * @param {number} total
+   * @returns {number[]}
+   */
+  missing(total) {
+    const result = [];
+    const lastWord = (total + 31) >>> 5;
+    for (let word = 0; word < lastWord; word++) {
+      let bits = ~(word < this.words.length ? this.words[word] : 0);
+      if (word === lastWord - 1 && (total & 31) !== 0) {
+        bits &= (1 << (total & 31)) - 1;
+      }
+      while (bits !== 0) {
+        const low = bits & -bits;
+        result.push(word * 32 + (31 - Math.clz32(low)));
+        bits ^= low;
+      }
+    }
+    return result;
+  }
+
+  /**
+   * Collapse the set indexes into sorted half-open [start, end) ranges
+   * @returns {Array<[number, number]>}
+   */
+  toRanges() {
+    const ranges = [];
+    let start = -1;
+    for (let word = 0; word < this.words.length; word++) {
+      const bits = this.words[word];
+      // Words that neither end the open range nor start a new one are skipped whole
+      if (start === -1 ? bits === 0 : bits === 0xFFFFFFFF) {
+        continue;
+      }
+      for (let bit = 0; bit < 32; bit++) {
+        const set = (bits & (1 << bit)) !== 0;
+        if (set && start === -1) {
+          start = word * 32 + bit;
+        } else if (!set && start !== -1) {
+          ranges.push([start, word * 32 + bit]);
+          start = -1;
+        }
+      }
+    }
+    if (start !== -1) {
+      ranges.push([start, this.words.length * 32]);
+    }
+    return ranges;
+  }
+}
+
+function popcount(bits) {
+  bits -= (bits >>> 1) & 0x55555555;
+  bits = (bits & 0x33333333) + ((bits >>> 2) & 0x33333333);
+  return (((bits + (bits >>> 4)) & 0x0F0F0F0F) * 0x01010101) >>> 24;
+}
+
+module.exports = { ChunkBitmap };
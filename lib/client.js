@@ -1,9 +1,14 @@
 const fs = require('fs');
 const path = require('path');
 const os = require('os');
+const crypto = require('crypto');
+const zlib = require('zlib');
+const { promisify } = require('util');
 const fetch = require('node-fetch');
 const readline = require('readline');
 const { createLogger } = require('./logger');
+const { mapWithConcurrency, mapSettledWithConcurrency, createLimiter } = require('./concurrency');
+const { ChunkBitmap } = require('./chunk-bitmap');
 
 // Set up database for different environments
 let openDB;
@@ -56,15 +61,117 @@ if (typeof window === 'undefined') {
   openDB = idbOpenDB;
 }
 
+// Minimum gap between per-chunk progress lines (~20 per second)
+const PROGRESS_LOG_INTERVAL = 50;
+
+// With compression on, a file whose first chunk compresses to more than this
+// fraction of its size is treated as already compressed and sent raw
+const COMPRESSION_PROBE_RATIO = 0.95;
+
+const gzip = promisify(zlib.gzip);
+// zstd (level 1) is preferred when both this Node and the server support it
+const zstdCompress = typeof zlib.zstdCompress === 'function' ? promisify(zlib.zstdCompress) : null;
+const ZSTD_OPTIONS = zstdCompress ? { params: { [zlib.constants.ZSTD_c_compressionLevel]: 1 } } : null;
+
+// Encrypted packets of a file are stored this many per transaction
+const PACKET_BATCH_SIZE = 64;
+
+// Failed attempts remembered in a record's retryMetadata.errors
+const RETRY_ERROR_HISTORY = 5;
+
+// Consecutive chunks are coalesced into one request sized so that it takes
+// about this long: per-request overhead (headers, round trip, server
+// bookkeeping) stays small, and a failed request is cheap to resend
+const TARGET_REQUEST_TIME = 1000;
+
+// How long a chunk sent with Expect: 100-continue waits for the go-ahead
+// before its body is sent anyway (servers that ignore Expect never answer)
+const EXPECT_CONTINUE_TIMEOUT = 1000;
+
+/**
+ * Adapt the number of chunks per request to how long the last request took:
+ * double while requests are fast (overhead-dominated), halve when slow.
+ */
+function nextChunksPerRequest(current, elapsed, max) {
+  if (elapsed < TARGET_REQUEST_TIME / 2) {
+    return Math.min(current * 2, max);
+  }
+  if (elapsed > TARGET_REQUEST_TIME * 2) {
+    return Math.max(1, Math.floor(current / 2));
+  }
+  return current;
+}
+
+/**
+ * Base64-encode binary data read back from IndexedDB. Structured clone turns
+ * Buffers into plain Uint8Arrays, and Buffer.from(typedArray) copies the bytes;
+ * wrapping the underlying ArrayBuffer does not.
+ */
+function toBase64(data) {
+  if (ArrayBuffer.isView(data)) {
+    return Buffer.from(data.buffer, data.byteOffset, data.byteLength).toString('base64');
+  }
+  return Buffer.from(data).toString('base64');
+}
+
+/**
+ * Whether a failed request is worth retrying. Network errors (no HTTP status),
+ * 5xx, 408 and 429 are transient; any other 4xx (bad API key, rejected
+ * filename, ...) will fail the same way again.
+ */
+function isRetryableError(error) {
+  const status = error && error.status;
+  if (!status) return true;
+  return status >= 500 || status === 408 || status === 429;
+}
+
+/**
+ * Whether the server rejected a completed upload because its data did not
+ * match X-File-SHA256
+ */
+function isChecksumMismatch(error) {
+  return Boolean(error) && error.status === 409;
+}
+
 class IndexedCPClient {
   constructor(options = {}) {
     this.db = null;
+    this.dbPromise = null; // In-flight initDB() open, shared by concurrent callers
     this.dbName = options.dbName || 'indexcp';
     this.storeName = options.storeName || 'chunks';
     this.apiKey = options.apiKey || null;
     this.chunkSize = options.chunkSize || 1024 * 1024; // Default 1MB
     this.serverUrl = options.serverUrl || null;
     
+    // Maximum number of uploads in flight at once (env: INDEXEDCP_PARALLEL_OPS)
+    this.parallelism = options.parallelism ||
+      parseInt(process.env.INDEXEDCP_PARALLEL_OPS, 10) || 8;
+    
+    // Chunk indexes the server already has, per `${serverUrl}\n${fileName}`.
+    // Filled from /upload/status once and then kept current locally.
+    this.receivedChunksCache = new Map();
+    
+    // Gzip chunks in transit when the server advertises support (opt-in)
+    this.compression = options.compression || false;
+    
+    // Upper bound for a request that coalesces consecutive chunks; the
+    // server's advertised limit applies too (set to chunkSize to disable)
+    this.maxRequestSize = options.maxRequestSize || 16 * 1024 * 1024;
+    
+    // What each server supports, from /upload/status response headers
+    this.serverCapabilities = new Map(); // serverUrl -> { gzip, zstd, maxRequestSize }
+    
+    // Keep-alive connection pools, created on first request (Node.js only)
+    // maxConnections defaults to parallelism; lower it (down to 1) to funnel
+    // all uploads through fewer warm sockets
+    this.maxConnections = options.maxConnections || this.parallelism;
+    this.httpAgents = null;
+    this.agent = (parsedUrl) => this.getAgent(parsedUrl);
+    this.requestLimiter = createLimiter(this.parallelism);
+    // Runs of buffered chunks being read, encoded and sent, across all files.
+    // Separate from requestLimiter, which each run's request also goes through.
+    this.runLimiter = createLimiter(this.parallelism);
+    
     // Logger configuration
     this.logger = createLogger({
       level: options.logLevel,
@@ -161,25 +268,164 @@ class IndexedCPClient {
     return this.apiKey;
   }
 
+  /**
+   * Get the keep-alive agent for a request URL so every chunk reuses a pooled
+   * connection instead of paying a new TCP (and TLS) handshake.
+   * @param {URL} parsedUrl - URL of the outgoing request
+   * @returns {http.Agent|https.Agent|undefined} Agent, or undefined in browsers
+   */
+  getAgent(parsedUrl) {
+    if (typeof window !== 'undefined') {
+      return undefined; // Browsers manage their own connection pool
+    }
+    
+    if (!this.httpAgents) {
+      const http = require('http');
+      const https = require('https');
+      // LIFO hands each request the most recently used socket, so a small
+      // working set stays warm (past TCP slow start) and surplus sockets
+      // idle out instead of being cycled through round-robin
+      const agentOptions = {
+        keepAlive: true,
+        keepAliveMsecs: 30000,
+        maxSockets: this.maxConnections,
+        scheduling: 'lifo'
+      };
+      this.httpAgents = {
+        http: new http.Agent(agentOptions),
+        https: new https.Agent(agentOptions)
+      };
+    }
+    
+    return parsedUrl.protocol === 'https:' ? this.httpAgents.https : this.httpAgents.http;
+  }
+
+  /**
+   * POST through the client-wide in-flight limit. Foreground uploads, the
+   * background loop and concurrent uploadBufferedFiles calls all share it, so
+   * together they never have more than `parallelism` requests outstanding.
+   * @private
+   */
+  fetchUpload(url, options) {
+    return this.requestLimiter(() => fetch(url, options));
+  }
+
+  /**
+   * POST with `Expect: 100-continue`, so the body is only sent once the server
+   * asks for it: a chunk it already has costs a round trip, not an upload.
+   * node-fetch writes the body straight away and can't wait for 100 Continue,
+   * so this uses http/https directly (Node only). Only the transport differs
+   * from fetchUpload: uploadChunk builds the headers (auth included) and
+   * handles the response and errors for both, and both use getAgent()'s
+   * pooled connections and the same in-flight limit.
+   * @private
+   * @returns {Promise<fetch.Response>}
+   */
+  postExpectingContinue(url, headers, body) {
+    return this.requestLimiter(() => new Promise((resolve, reject) => {
+      const parsedUrl = new URL(url);
+      const transport = parsedUrl.protocol === 'https:' ? require('https') : require('http');
+      const req = transport.request(parsedUrl, {
+        method: 'POST',
+        agent: this.getAgent(parsedUrl),
+        headers: { ...headers, 'Content-Length': body.length.toString(), 'Expect': '100-continue' }
+      });
+      
+      let sent = false;
+      const send = () => {
+        if (!sent) {
+          sent = true;
+          req.end(body);
+        }
+      };
+      const timer = setTimeout(send, EXPECT_CONTINUE_TIMEOUT);
+      timer.unref();
+      
+      req.on('continue', send);
+      req.on('error', (error) => {
+        clearTimeout(timer);
+        reject(error);
+      });
+      req.on('response', (res) => {
+        clearTimeout(timer);
+        const parts = [];
+        res.on('data', (data) => parts.push(data));
+        res.on('error', reject);
+        res.on('end', () => {
+          // Answered without the body: the connection can't carry another request
+          if (!sent) {
+            req.destroy();
+          }
+          resolve(new fetch.Response(Buffer.concat(parts), {
+            status: res.statusCode,
+            statusText: res.statusMessage,
+            headers: res.headers
+          }));
+        });
+      });
+    }));
+  }
+
+  /**
+   * Stop background uploads and release pooled connections
+   */
+  close() {
+    this.stopUploadBackground();
+    
+    if (this.httpAgents) {
+      this.httpAgents.http.destroy();
+      this.httpAgents.https.destroy();
+      this.httpAgents = null;
+    }
+  }
+
   async initDB() {
     if (!this.db) {
-      if (this.encryption) {
-        // Use encrypted database schema
-        this.db = await this.encryptedDB(this.dbName, 3);
-      } else {
-        // Use original simple schema
-        this.db = await openDB(this.dbName, 1, {
-          upgrade(db) {
-            if (!db.objectStoreNames.contains('chunks')) {
-              db.createObjectStore('chunks', { keyPath: 'id', autoIncrement: true });
-            }
-          }
+      // Concurrent first callers (e.g. parallel addFile calls, or the
+      // background loop starting alongside an upload) share one open request
+      // instead of each opening a connection
+      if (!this.dbPromise) {
+        this.dbPromise = this.openDatabase().catch(error => {
+          this.dbPromise = null;
+          throw error;
         });
       }
+      this.db = await this.dbPromise;
     }
     return this.db;
   }
 
+  /**
+   * Open the IndexedDB database for the configured mode
+   * @private
+   */
+  async openDatabase() {
+    if (this.encryption) {
+      // Use encrypted database schema
+      return this.encryptedDB(this.dbName, 3);
+    }
+    
+    // Use original simple schema
+    return openDB(this.dbName, 2, {
+      upgrade(db, oldVersion, newVersion, transaction) {
+        const store = db.objectStoreNames.contains('chunks')
+          ? transaction.objectStore('chunks')
+          : db.createObjectStore('chunks', { keyPath: 'id', autoIncrement: true });
+        
+        // v2: find buffered files, and their chunks in order, without
+        // loading chunk data. Chunk ids are compact auto-increment keys;
+        // the unique (fileName, chunkIndex) index rejects a file that is
+        // already buffered, as the old `${fileName}-${index}` ids did.
+        if (!store.indexNames.contains('fileName')) {
+          store.createIndex('fileName', 'fileName');
+        }
+        if (!store.indexNames.contains('fileChunk')) {
+          store.createIndex('fileChunk', ['fileName', 'chunkIndex'], { unique: true });
+        }
+      }
+    });
+  }
+
   // ============================================================================
   // Encryption Methods (only used when encryption: true)
   // ============================================================================
@@ -196,7 +442,7 @@ class IndexedCPClient {
       throw new Error('serverUrl required for fetchPublicKey()');
     }
     
-    const response = await fetch(`${this.serverUrl}/public-key`);
+    const response = await fetch(`${this.serverUrl}/public-key`, { agent: this.agent });
     
     if (!response.ok) {
       throw new Error(`Failed to fetch public key: ${response.statusText}`);
@@ -311,7 +557,19 @@ class IndexedCPClient {
     }
     
     const db = await this.initDB();
+    const record = await this.encryptPacketRecord(sessionId, data, seq);
     
+    // Store encrypted packet
+    const tx = db.transaction('packets', 'readwrite');
+    await tx.objectStore('packets').put(record);
+    await tx.done;
+  }
+
+  /**
+   * Encrypt data into a packet record for the packets store
+   * @private
+   */
+  async encryptPacketRecord(sessionId, data, seq = null) {
     // Get session key from memory
     const sessionKey = this.sessionKeys.get(sessionId);
     if (!sessionKey) {
@@ -335,9 +593,7 @@ class IndexedCPClient {
       timestamp: Date.now()
     });
     
-    // Store encrypted packet
-    const tx = db.transaction('packets', 'readwrite');
-    await tx.objectStore('packets').put({
+    return {
       id: `${sessionId}-${seq}`,
       sessionId,
       seq,
@@ -347,8 +603,22 @@ class IndexedCPClient {
       aad: encrypted.aad,
       status: 'pending',
       createdAt: Date.now()
-    });
-    await tx.done;
+    };
+  }
+
+  /**
+   * Wait for a batch of packet records to be encrypted, then store them in a
+   * single readwrite transaction
+   * @private
+   */
+  async storePacketBatch(db, recordPromises) {
+    const records = await Promise.all(recordPromises);
+    const tx = db.transaction('packets', 'readwrite');
+    const store = tx.objectStore('packets');
+    await Promise.all([
+      ...records.map(record => store.put(record)),
+      tx.done
+    ]);
   }
 
   /**
@@ -393,37 +663,122 @@ class IndexedCPClient {
     }
     
     // Original unencrypted logic
-    return new Promise((resolve, reject) => {
-      const readStream = fs.createReadStream(filePath, { highWaterMark: this.chunkSize });
-      let chunkIndex = 0;
-      const fileName = filePath;
-      const chunks = [];
-
-      readStream.on('data', (chunk) => {
-        chunks.push({
-          id: `${fileName}-${chunkIndex}`, 
-          fileName: fileName,
-          chunkIndex: chunkIndex,
-          data: chunk 
-        });
-        chunkIndex++;
+    const fileName = filePath;
+    const chunks = await this.buildChunkRecords(filePath);
+
+    await this.addChunkRecords(db, chunks);
+    this.logger.info(`File ${fileName} added to buffer with ${chunks.length} chunks`);
+    return chunks.length;
+  }
+
+  /**
+   * Read a file into buffer records, one per chunk. Records get a compact
+   * auto-increment id when stored; (fileName, chunkIndex) identifies them.
+   * @private
+   */
+  async buildChunkRecords(filePath) {
+    const chunks = [];
+    const hash = crypto.createHash('sha256');
+    let chunkIndex = 0;
+    let fileSize = 0;
+
+    for await (const chunk of this.readFileChunks(filePath)) {
+      hash.update(chunk);
+      fileSize += chunk.length;
+      chunks.push({
+        fileName: filePath,
+        chunkIndex: chunkIndex,
+        data: chunk
       });
+      chunkIndex++;
+    }
 
-      readStream.on('end', async () => {
-        try {
-          // Add all chunks to IndexedDB
-          for (const chunk of chunks) {
-            await db.add(this.storeName, chunk);
-          }
-          this.logger.info(`File ${fileName} added to buffer with ${chunkIndex} chunks`);
-          resolve(chunkIndex);
-        } catch (error) {
-          reject(error);
+    // Lets the server track which chunks it has and when the upload is complete,
+    // and write each chunk at its offset in a file sized up front
+    for (const chunk of chunks) {
+      chunk.totalChunks = chunks.length;
+      chunk.fileSize = fileSize;
+      chunk.chunkSize = this.chunkSize;
+    }
+
+    // Whole-file digest, hashed in the same pass. Sent with every chunk: the
+    // server checks the finished file against it, and keys its tracking on
+    // it so that another file uploaded under the same name is kept apart.
+    const fileSha256 = hash.digest('hex');
+    for (const chunk of chunks) {
+      chunk.fileSha256 = fileSha256;
+    }
+
+    return chunks;
+  }
+
+  /**
+   * Read a file front to back in chunkSize pieces. The size is known up front,
+   * so each chunk is one exactly-sized positional read rather than a stream
+   * buffer that is filled and re-sliced.
+   * @private
+   * @param {string} filePath - File to read
+   * @yields {Buffer} Chunk data (the last chunk may be shorter)
+   */
+  async *readFileChunks(filePath) {
+    const handle = await fs.promises.open(filePath, 'r');
+    
+    try {
+      const { size } = await handle.stat();
+      let position = 0;
+      
+      while (position < size) {
+        const length = Math.min(this.chunkSize, size - position);
+        // Every byte is overwritten by the read (short reads are sliced off),
+        // so skip the zero-fill. Not from the shared pool: a small pooled
+        // Buffer is a view into an 8 KiB ArrayBuffer, and storing the record
+        // would structured-clone all of it.
+        const buffer = Buffer.allocUnsafeSlow(length);
+        let filled = 0;
+        
+        while (filled < length) {
+          const { bytesRead } = await handle.read(buffer, filled, length - filled, position + filled);
+          if (bytesRead === 0) break; // File was truncated while reading
+          filled += bytesRead;
         }
-      });
+        
+        if (filled === 0) break;
+        position += filled;
+        yield filled < length ? buffer.subarray(0, filled) : buffer;
+      }
+    } finally {
+      await handle.close();
+    }
+  }
 
-      readStream.on('error', reject);
-    });
+  /**
+   * Insert chunk records in a single readwrite transaction instead of one
+   * implicit transaction (and commit) per chunk. Each record's `id` is set to
+   * the key the store assigned.
+   * @private
+   */
+  async addChunkRecords(db, records) {
+    const tx = db.transaction(this.storeName, 'readwrite');
+    const store = tx.objectStore(this.storeName);
+    await Promise.all([
+      ...records.map(async record => {
+        record.id = await store.add(record);
+      }),
+      tx.done
+    ]);
+  }
+
+  /**
+   * Delete chunk records by id in a single transaction
+   * @private
+   */
+  async deleteChunkRecords(db, ids) {
+    const tx = db.transaction(this.storeName, 'readwrite');
+    const store = tx.objectStore(this.storeName);
+    await Promise.all([
+      ...ids.map(id => store.delete(id)),
+      tx.done
+    ]);
   }
 
   /**
@@ -434,51 +789,50 @@ class IndexedCPClient {
     const db = await this.initDB();
     const fileName = filePath;
     let sessionId;
+    let handle;
     
     try {
       // Start encrypted stream
       sessionId = await this.startStream(fileName);
+      handle = await fs.promises.open(filePath, 'r');
       
-      return new Promise((resolve, reject) => {
-        const readStream = fs.createReadStream(filePath, { highWaterMark: this.chunkSize });
-        let seq = 0;
-        const packetPromises = [];
-
-        readStream.on('data', (chunk) => {
-          const currentSeq = seq++;
-          const promise = this.addPacket(sessionId, chunk, currentSeq);
-          packetPromises.push(promise);
-        });
-
-        readStream.on('end', async () => {
-          try {
-            // Wait for all packets to be encrypted and stored
-            await Promise.all(packetPromises);
-            
-            // Clear session key from memory (AC1 - keys only during capture)
-            this.sessionKeys.delete(sessionId);
-            
-            this.logger.info(`✓ File ${fileName} encrypted and buffered (${seq} packets)`);
-            resolve(sessionId);
-          } catch (error) {
-            // Clean up session key on error
-            this.sessionKeys.delete(sessionId);
-            reject(error);
-          }
-        });
-
-        readStream.on('error', (error) => {
-          // Clean up session key on error
-          this.sessionKeys.delete(sessionId);
-          reject(error);
-        });
-      });
-    } catch (error) {
-      // Clean up session key if stream start failed
+      // One read buffer for the whole file: encryptPacket() has copied each
+      // chunk into the cipher before the next read overwrites it
+      const buffer = Buffer.allocUnsafeSlow(this.chunkSize);
+      let seq = 0;
+      // Packets are encrypted as they are read and committed in batches,
+      // one transaction per PACKET_BATCH_SIZE packets instead of one each
+      let pending = [];
+      const batchPromises = [];
+      
+      for (;;) {
+        const { bytesRead } = await handle.read(buffer, 0, buffer.length, null);
+        if (bytesRead === 0) {
+          break;
+        }
+        pending.push(this.encryptPacketRecord(sessionId, buffer.subarray(0, bytesRead), seq++));
+        if (pending.length >= PACKET_BATCH_SIZE) {
+          batchPromises.push(this.storePacketBatch(db, pending));
+          pending = [];
+        }
+      }
+      if (pending.length > 0) {
+        batchPromises.push(this.storePacketBatch(db, pending));
+      }
+      
+      // Wait for all packets to be encrypted and stored
+      await Promise.all(batchPromises);
+      
+      this.logger.info(`✓ File ${fileName} encrypted and buffered (${seq} packets)`);
+      return sessionId;
+    } finally {
+      if (handle) {
+        await handle.close();
+      }
+      // Clear session key from memory (AC1 - keys only during capture)
       if (sessionId) {
         this.sessionKeys.delete(sessionId);
       }
-      throw error;
     }
   }
 
@@ -497,35 +851,30 @@ class IndexedCPClient {
     const apiKey = await this.getApiKey();
     
     const db = await this.initDB();
-    const transaction = db.transaction(this.storeName, 'readonly');
-    const store = transaction.objectStore(this.storeName);
-    const allRecords = await store.getAll();
     
-    this.logger.info(`Found ${allRecords.length} buffered chunks`);
+    // Only keys are read here; chunk data is loaded a run at a time as it is
+    // uploaded. Runs are sent inside runLimiter's `parallelism` slots, and
+    // each file being uploaded reads at most one chunk ahead, so memory stays
+    // at O(maxRequestSize × parallelism) however many files are in flight.
+    const fileNames = await this.getBufferedFileNames(db);
     
-    if (allRecords.length === 0) {
+    if (fileNames.length === 0) {
       this.logger.info('No buffered files to upload');
       return {};
     }
-    
-    // Group records by fileName
-    const fileGroups = {};
-    allRecords.forEach(record => {
-      if (!fileGroups[record.fileName]) {
-        fileGroups[record.fileName] = [];
-      }
-      fileGroups[record.fileName].push(record);
-    });
 
-    this.logger.info(`Grouped into ${Object.keys(fileGroups).length} files:`, Object.keys(fileGroups));
+    this.logger.info(`Found ${fileNames.length} buffered files:`, fileNames);
 
-    // Upload all files in parallel (non-blocking)
-    const uploadPromises = Object.entries(fileGroups).map(([fileName, chunks]) =>
-      this.uploadFileChunks(serverUrl, fileName, chunks, db, apiKey)
+    // Upload files in parallel, bounded by this.parallelism
+    const results = await mapWithConcurrency(
+      fileNames,
+      this.parallelism,
+      async (fileName) => {
+        const chunks = await this.getBufferedChunkKeys(db, fileName);
+        return this.uploadFileChunks(serverUrl, fileName, chunks, db, apiKey);
+      }
     );
     
-    const results = await Promise.all(uploadPromises);
-    
     // Combine results
     const uploadResults = {};
     results.forEach(result => {
@@ -536,7 +885,63 @@ class IndexedCPClient {
   }
 
   /**
-   * Upload a single file's chunks in order
+   * List the distinct file names in the buffer
+   * @private
+   */
+  async getBufferedFileNames(db) {
+    const fileNames = [];
+    const index = db.transaction(this.storeName).store.index('fileName');
+    
+    let cursor = await index.openKeyCursor(null, 'nextunique');
+    while (cursor) {
+      fileNames.push(cursor.key);
+      cursor = await cursor.continue();
+    }
+    return fileNames;
+  }
+
+  /**
+   * Get { id, chunkIndex } for each buffered chunk of a file, in chunk order,
+   * without reading chunk data
+   * @private
+   */
+  async getBufferedChunkKeys(db, fileName) {
+    const chunks = [];
+    const index = db.transaction(this.storeName).store.index('fileChunk');
+    const range = IDBKeyRange.bound([fileName, 0], [fileName, Infinity]);
+    
+    let cursor = await index.openKeyCursor(range);
+    while (cursor) {
+      chunks.push({ id: cursor.primaryKey, chunkIndex: cursor.key[1] });
+      cursor = await cursor.continue();
+    }
+    return chunks;
+  }
+
+  /**
+   * How many consecutive chunks one request may carry for this server: 1
+   * unless the server advertised a request size limit (older servers cannot
+   * take more than one chunk per request)
+   * @private
+   * @param {string} serverUrl
+   * @param {number} chunkSize - Chunk size the file was buffered with, which
+   *   may differ from this client's chunkSize
+   */
+  getMaxChunksPerRequest(serverUrl, chunkSize) {
+    const capabilities = this.serverCapabilities.get(serverUrl);
+    if (!capabilities || !capabilities.maxRequestSize) {
+      return 1;
+    }
+    const limit = Math.min(this.maxRequestSize, capabilities.maxRequestSize);
+    return Math.max(1, Math.floor(limit / chunkSize));
+  }
+
+  /**
+   * Upload a single file's chunks. Chunks without `data` (from
+   * getBufferedChunkKeys) are read from the buffer just before they are sent.
+   * Chunks go out one request at a time, in order, until the server confirms
+   * it writes them at their offsets; from then on up to `parallelism`
+   * requests for the file run at once.
    * @private
    */
   async uploadFileChunks(serverUrl, fileName, chunks, db, apiKey) {
@@ -547,23 +952,216 @@ class IndexedCPClient {
     
     let serverFilename = null;
     
-    // Upload chunks sequentially to preserve order
-    for (const chunk of chunks) {
-      this.logger.info(`Uploading chunk ${chunk.chunkIndex} for ${fileName}`);
-      const response = await this.uploadChunk(serverUrl, chunk.data, chunk.chunkIndex, fileName, apiKey);
+    // Size and digest identify the file to the server; every chunk (and the
+    // status query) carries the same ones
+    if (chunks[0].data === undefined) {
+      chunks[0] = await db.get(this.storeName, chunks[0].id);
+    }
+    const { totalChunks, fileSize, chunkSize, fileSha256 } = chunks[0];
+    
+    // Chunks the server already has (from an interrupted earlier run); chunks
+    // it acknowledges are added as requests complete
+    const received = await this.getReceivedChunks(serverUrl, fileName, apiKey, { fileSize, chunkSize, fileSha256 });
+    
+    // Writing a line per chunk to a slow terminal adds up on large files, so
+    // progress is throttled; the last chunk is always reported
+    let done = 0;
+    let lastProgressLog = 0;
+    const logProgress = (message) => {
+      const now = Date.now();
+      if (done === chunks.length || now - lastProgressLog >= PROGRESS_LOG_INTERVAL) {
+        lastProgressLog = now;
+        this.logger.info(`[${done}/${chunks.length}] ${message}`);
+      }
+    };
+    
+    // Runs of consecutive chunks the server still needs go out as one request,
+    // with the run length adapted to request time (nextChunksPerRequest).
+    // Runs are only coalesced once the server has confirmed it writes chunks
+    // at their offsets: appended, a run overlapping chunks it already has
+    // (which a stale view of the upload allows) would duplicate their bytes.
+    const maxChunksPerRequest = this.getMaxChunksPerRequest(serverUrl, chunkSize || this.chunkSize);
+    let chunksPerRequest = 1;
+    let positional = false;
+    
+    // Once a duplicate reply shows our view of the server is stale, any chunk
+    // may already be there: let the server turn down its body (Expect:
+    // 100-continue) rather than send it regardless. Until then the status
+    // reply is trusted, and chunks go out without the extra round trip.
+    let expectContinue = false;
+    
+    let next = 0; // First chunk not yet claimed by a request
+    let failed = false; // Set on the first failure; no new requests start after it
+    
+    // Claim the next run and start reading it from the buffer, so the read
+    // overlaps whatever request is on the wire
+    const claimRun = () => {
+      while (next < chunks.length && received.has(chunks[next].chunkIndex)) {
+        done++;
+        logProgress(`Chunk ${chunks[next].chunkIndex} for ${fileName} already on server, skipping`);
+        next++;
+      }
+      if (failed || next >= chunks.length) {
+        return null;
+      }
       
+      const start = next;
+      let end = start + 1;
+      while (end < chunks.length && end - start < (positional ? chunksPerRequest : 1) &&
+             !received.has(chunks[end].chunkIndex) &&
+             chunks[end].chunkIndex === chunks[end - 1].chunkIndex + 1) {
+        end++;
+      }
+      next = end;
+      
+      const promise = Promise.all(chunks.slice(start, end).map(chunk =>
+        chunk.data === undefined ? db.get(this.storeName, chunk.id) : chunk
+      ));
+      promise.catch(() => {}); // Rejections surface where the promise is awaited
+      return { start, end, promise };
+    };
+    
+    const compressionState = {};
+    
+    const sendRecords = async (records) => {
+      const first = records[0];
+      const last = records[records.length - 1];
+      
+      const data = records.length > 1 ? Buffer.concat(records.map(record => record.data)) : first.data;
+      const { body, contentEncoding } = await this.encodeChunk(serverUrl, data, compressionState);
+      
+      const started = Date.now();
+      const response = await this.uploadChunk(serverUrl, body, first.chunkIndex, fileName, apiKey, {
+        chunkCount: records.length,
+        totalChunks,
+        fileSize,
+        chunkSize,
+        fileSha256,
+        contentEncoding,
+        expectContinue
+      });
+      chunksPerRequest = nextChunksPerRequest(chunksPerRequest, Date.now() - started, maxChunksPerRequest);
+      
+      const reply = response.data || {};
       // Capture server-determined filename from first chunk response
-      if (response.data && response.data.actualFilename && !serverFilename) {
-        serverFilename = response.data.actualFilename;
+      if (reply.actualFilename && !serverFilename) {
+        serverFilename = reply.actualFilename;
+      }
+      if (reply.positional) {
+        positional = true;
       }
       
-      await db.delete(this.storeName, chunk.id);
+      if (reply.alreadyReceived) {
+        expectContinue = true;
+        // Only the first chunk is known to be there; the reply's ranges
+        // (merged into `received`) tell whether the rest are
+        received.add(first.chunkIndex);
+        for (const [start, end] of reply.ranges || []) {
+          received.addRange(start, end);
+        }
+        return true;
+      }
+      for (const record of records) {
+        received.add(record.chunkIndex);
+      }
+      done += records.length;
+      logProgress(records.length > 1
+        ? `Uploaded chunks ${first.chunkIndex}-${last.chunkIndex} for ${fileName}`
+        : `Uploaded chunk ${first.chunkIndex} for ${fileName}`);
+      return false;
+    };
+    
+    // Send a claimed run, minus any chunks a duplicate's reply has reported
+    // since it was claimed
+    const sendRun = async (run) => {
+      const records = await run.promise;
+      let start = run.start;
+      while (start < run.end) {
+        if (received.has(chunks[start].chunkIndex)) {
+          done++;
+          start++;
+          continue;
+        }
+        let end = start + 1;
+        while (end < run.end && !received.has(chunks[end].chunkIndex)) {
+          end++;
+        }
+        const duplicate = await sendRecords(records.slice(start - run.start, end - run.start));
+        // After a duplicate reply, look at the same chunks again
+        if (!duplicate) {
+          start = end;
+        }
+      }
+    };
+    
+    // Claim and send one run inside a client-wide run slot (see runLimiter);
+    // resolves false once there is nothing left to send
+    const sendNextRun = (pending) => this.runLimiter(async () => {
+      const run = pending.pop() || claimRun();
+      if (!run) {
+        return false;
+      }
+      try {
+        await sendRun(run);
+      } catch (error) {
+        failed = true;
+        throw error;
+      }
+      return true;
+    });
+    
+    let mismatch = false;
+    
+    try {
+      // In order until a reply confirms positional writes (appending servers
+      // never do); the next chunk is read while the current one is sent
+      let run = claimRun();
+      while (run && !positional) {
+        const pending = [run];
+        run = claimRun();
+        await sendNextRun(pending);
+      }
+      
+      if (run) {
+        // Chunks may now land in any order: keep up to `parallelism` requests
+        // in flight, starting with the run already claimed
+        const pending = [run];
+        const results = await mapSettledWithConcurrency(
+          Array.from({ length: this.parallelism }),
+          this.parallelism,
+          async () => {
+            while (await sendNextRun(pending)) {
+              // Keep going until every chunk is claimed (or one has failed)
+            }
+          }
+        );
+        const rejected = results.find(result => result.status === 'rejected');
+        if (rejected) {
+          throw rejected.reason;
+        }
+      }
+    } catch (error) {
+      mismatch = isChecksumMismatch(error);
+      throw error;
+    } finally {
+      // Chunks the server has are removed from the buffer in one transaction
+      // (its chunk tracking covers a crash before that); the rest stay
+      // buffered for the next attempt. On a checksum mismatch every chunk
+      // stays buffered (see _uploadFileChunksWithRetry).
+      const uploadedIds = chunks.filter(chunk => received.has(chunk.chunkIndex)).map(chunk => chunk.id);
+      if (uploadedIds.length > 0 && !mismatch) {
+        await this.deleteChunkRecords(db, uploadedIds);
+      }
     }
     
+    // Every buffered chunk is on the server, so the server has stopped tracking it
+    this.receivedChunksCache.delete(`${serverUrl}\n${fileName}`);
+    
     // Store the mapping of client filename to server filename
-    serverFilename = serverFilename || require('path').basename(fileName);
+    const baseName = path.basename(fileName);
+    serverFilename = serverFilename || baseName;
     
-    if (serverFilename !== require('path').basename(fileName)) {
+    if (serverFilename !== baseName) {
       this.logger.info(`Upload complete for ${fileName} -> Server saved as: ${serverFilename}`);
     } else {
       this.logger.info(`Upload complete for ${fileName}`);
@@ -600,13 +1198,13 @@ class IndexedCPClient {
       sessionGroups[packet.sessionId].push(packet);
     });
     
-    // Upload all sessions in parallel (non-blocking)
-    const uploadPromises = Object.entries(sessionGroups).map(([sessionId, sessionPackets]) =>
-      this.uploadSession(serverUrl, sessionId, sessionPackets, db, apiKey)
+    // Upload sessions in parallel, bounded by this.parallelism
+    const results = await mapWithConcurrency(
+      Object.entries(sessionGroups),
+      this.parallelism,
+      ([sessionId, sessionPackets]) => this.uploadSession(serverUrl, sessionId, sessionPackets, db, apiKey)
     );
     
-    const results = await Promise.all(uploadPromises);
-    
     // Combine results
     const uploadResults = {};
     results.forEach(result => {
@@ -710,22 +1308,23 @@ class IndexedCPClient {
       const payload = {
         sessionId: packet.sessionId,
         kid: session.kid,
-        wrappedKey: Buffer.from(session.wrappedKey).toString('base64'),
-        ciphertext: Buffer.from(packet.ciphertext).toString('base64'),
-        iv: Buffer.from(packet.iv).toString('base64'),
-        authTag: Buffer.from(packet.authTag).toString('base64'),
-        aad: Buffer.from(packet.aad).toString('base64'),
+        wrappedKey: toBase64(session.wrappedKey),
+        ciphertext: toBase64(packet.ciphertext),
+        iv: toBase64(packet.iv),
+        authTag: toBase64(packet.authTag),
+        aad: toBase64(packet.aad),
         seq: packet.seq,
         fileName: session.fileName
       };
       
-      const response = await fetch(`${serverUrl}/upload-encrypted`, {
+      const response = await this.fetchUpload(`${serverUrl}/upload-encrypted`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${apiKey}`
         },
-        body: JSON.stringify(payload)
+        body: JSON.stringify(payload),
+        agent: this.agent
       });
       
       if (!response.ok) {
@@ -738,24 +1337,25 @@ class IndexedCPClient {
       const payload = {
         sessionId: packets[0].sessionId,
         kid: session.kid,
-        wrappedKey: Buffer.from(session.wrappedKey).toString('base64'),
+        wrappedKey: toBase64(session.wrappedKey),
         fileName: session.fileName,
         packets: packets.map(packet => ({
-          ciphertext: Buffer.from(packet.ciphertext).toString('base64'),
-          iv: Buffer.from(packet.iv).toString('base64'),
-          authTag: Buffer.from(packet.authTag).toString('base64'),
-          aad: Buffer.from(packet.aad).toString('base64'),
+          ciphertext: toBase64(packet.ciphertext),
+          iv: toBase64(packet.iv),
+          authTag: toBase64(packet.authTag),
+          aad: toBase64(packet.aad),
           seq: packet.seq
         }))
       };
       
-      const response = await fetch(`${serverUrl}/upload-encrypted-batch`, {
+      const response = await this.fetchUpload(`${serverUrl}/upload-encrypted-batch`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${apiKey}`
         },
-        body: JSON.stringify(payload)
+        body: JSON.stringify(payload),
+        agent: this.agent
       });
       
       if (!response.ok) {
@@ -766,27 +1366,176 @@ class IndexedCPClient {
     }
   }
 
-  async uploadChunk(serverUrl, chunk, index, fileName, apiKey) {
+  /**
+   * Get the chunk indexes the server already holds for a file, so a resumed
+   * upload can skip them. The first call per file asks GET <serverUrl>/status;
+   * after that the cached set is updated locally as chunks are sent and only
+   * re-fetched after a network error.
+   * @param {string} serverUrl - Upload URL (e.g. http://host:3000/upload)
+   * @param {string} fileName - Client file name as sent in X-File-Name
+   * @param {string} [apiKey] - API key
+   * @param {Object} [file] - The fileSize, chunkSize and fileSha256 the
+   *   chunks are sent with, which the server tracks the upload under
+   * @returns {Promise<ChunkBitmap>} Received chunk indexes
+   */
+  async getReceivedChunks(serverUrl, fileName, apiKey, file = {}) {
+    const cacheKey = `${serverUrl}\n${fileName}`;
+    const cached = this.receivedChunksCache.get(cacheKey);
+    if (cached) {
+      return cached;
+    }
+    
     if (!apiKey) {
       apiKey = await this.getApiKey();
     }
     
-    const response = await fetch(serverUrl, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/octet-stream',
-        'X-Chunk-Index': index.toString(),
-        'X-File-Name': fileName,
-        'Authorization': `Bearer ${apiKey}`
-      },
-      body: chunk
+    let response;
+    try {
+      let query = `filename=${encodeURIComponent(fileName)}`;
+      if (file.fileSize !== undefined && file.chunkSize) {
+        query += `&size=${file.fileSize}`;
+      }
+      if (file.fileSha256) {
+        query += `&sha256=${file.fileSha256}`;
+      }
+      response = await fetch(`${serverUrl}/status?${query}`, {
+        headers: {
+          'Accept': 'application/vnd.indexcp.ranges+json, application/json',
+          'Authorization': `Bearer ${apiKey}`
+        },
+        agent: this.agent
+      });
+    } catch (error) {
+      // Server unreachable: nothing is known, and the upload will report the error
+      return new ChunkBitmap();
+    }
+    
+    const acceptEncoding = response.headers.get('accept-encoding') || '';
+    this.serverCapabilities.set(serverUrl, {
+      gzip: response.ok && /\bgzip\b/.test(acceptEncoding),
+      zstd: response.ok && zstdCompress !== null && /\bzstd\b/.test(acceptEncoding),
+      maxRequestSize: response.ok ? parseInt(response.headers.get('x-max-request-size'), 10) || 0 : 0
     });
     
+    let received = new ChunkBitmap();
+    
+    if (response.ok) {
+      const status = await response.json();
+      if (status.ranges) {
+        received = ChunkBitmap.fromRanges(status.ranges);
+      } else if (status.receivedChunks) {
+        status.receivedChunks.forEach(index => received.add(index));
+      }
+    } else if (response.status !== 404) {
+      // 404: server predates chunk tracking, so there is nothing to resume
+      return received;
+    }
+    
+    this.receivedChunksCache.set(cacheKey, received);
+    return received;
+  }
+
+  /**
+   * Compress a chunk for upload when compression is enabled and the server
+   * accepts it: zstd if both sides support it, otherwise gzip. `state` is per
+   * file: the first chunk is a probe, and if it barely shrinks the file is
+   * assumed to be already compressed and the rest is sent raw. Any single
+   * chunk that does not shrink is also sent raw.
+   * @private
+   * @returns {Promise<{ body: Buffer|Uint8Array, contentEncoding?: string }>}
+   */
+  async encodeChunk(serverUrl, data, state) {
+    const capabilities = this.serverCapabilities.get(serverUrl);
+    if (!this.compression || state.disabled || !capabilities || !(capabilities.zstd || capabilities.gzip)) {
+      return { body: data };
+    }
+    
+    const encoding = capabilities.zstd ? 'zstd' : 'gzip';
+    const compressed = encoding === 'zstd'
+      ? await zstdCompress(data, ZSTD_OPTIONS)
+      : await gzip(data, { level: zlib.constants.Z_BEST_SPEED });
+    
+    if (!state.probed) {
+      state.probed = true;
+      if (compressed.length >= data.length * COMPRESSION_PROBE_RATIO) {
+        state.disabled = true;
+        return { body: data };
+      }
+    }
+    
+    return compressed.length < data.length
+      ? { body: compressed, contentEncoding: encoding }
+      : { body: data };
+  }
+
+  /**
+   * Upload one chunk
+   * @param {Object} [options]
+   * @param {number} [options.chunkCount] - Consecutive chunks in `chunk`, starting at `index`
+   * @param {number} [options.totalChunks] - Chunks in the file (enables server-side tracking)
+   * @param {number} [options.fileSize] - File size in bytes (lets the server size the file up front)
+   * @param {number} [options.chunkSize] - Size of every chunk but the last (locates `index` in the file)
+   * @param {string} [options.fileSha256] - Whole-file digest (the same on every chunk)
+   * @param {string} [options.contentEncoding] - Set when `chunk` is already compressed
+   * @param {boolean} [options.expectContinue] - Send the body only once the
+   *   server asks for it (Node only); worth it when the chunk may be a duplicate
+   */
+  async uploadChunk(serverUrl, chunk, index, fileName, apiKey, options = {}) {
+    if (!apiKey) {
+      apiKey = await this.getApiKey();
+    }
+    
+    const headers = {
+      'Content-Type': 'application/octet-stream',
+      'X-Chunk-Index': index.toString(),
+      'X-File-Name': fileName,
+      'Authorization': `Bearer ${apiKey}`
+    };
+    if (options.chunkCount > 1) {
+      headers['X-Chunk-Count'] = options.chunkCount.toString();
+    }
+    if (options.totalChunks) {
+      headers['X-Total-Chunks'] = options.totalChunks.toString();
+    }
+    if (options.fileSize !== undefined && options.chunkSize) {
+      headers['X-File-Size'] = options.fileSize.toString();
+      headers['X-Chunk-Size'] = options.chunkSize.toString();
+    }
+    if (options.fileSha256) {
+      headers['X-File-SHA256'] = options.fileSha256;
+    }
+    if (options.contentEncoding) {
+      headers['Content-Encoding'] = options.contentEncoding;
+    }
+    
+    let response;
+    try {
+      response = options.expectContinue && typeof window === 'undefined'
+        ? await this.postExpectingContinue(serverUrl, headers, chunk)
+        : await this.fetchUpload(serverUrl, {
+          method: 'POST',
+          headers,
+          body: chunk,
+          agent: this.agent
+        });
+    } catch (error) {
+      // We no longer know what reached the server; re-query before resuming
+      this.receivedChunksCache.delete(`${serverUrl}\n${fileName}`);
+      throw error;
+    }
+    
     if (!response.ok) {
-      if (response.status === 401) {
-        throw new Error('Authentication failed: Invalid API key');
+      if (response.status === 409) {
+        // The server dropped the file and its tracking; start over next time
+        this.receivedChunksCache.delete(`${serverUrl}\n${fileName}`);
       }
-      throw new Error(`Upload failed: ${response.statusText}`);
+      const error = response.status === 401
+        ? new Error('Authentication failed: Invalid API key')
+        : response.status === 409
+          ? new Error(`Checksum mismatch: server rejected ${fileName}`)
+          : new Error(`Upload failed: ${response.statusText}`);
+      error.status = response.status;
+      throw error;
     }
     
     // Try to parse response as JSON (new format) or fall back to text (backward compatibility)
@@ -797,9 +1546,22 @@ class IndexedCPClient {
       if (contentType && contentType.includes('application/json')) {
         responseData = await response.json();
         
-        // Log server-determined filename if it differs from client filename
-        if (responseData.actualFilename && responseData.actualFilename !== fileName && responseData.actualFilename !== require('path').basename(fileName)) {
-          this.logger.info(`Server used filename: ${responseData.actualFilename} (client sent: ${fileName})`);
+        // A duplicate means our idea of what the server has is stale; the
+        // reply lists what it does have, so later chunks can be skipped
+        if (responseData.alreadyReceived && Array.isArray(responseData.ranges)) {
+          const received = this.receivedChunksCache.get(`${serverUrl}\n${fileName}`);
+          if (received) {
+            for (const [start, end] of responseData.ranges) {
+              received.addRange(start, end);
+            }
+          }
+        }
+        
+        // Server-determined filename, if it differs from the client filename
+        // (logged per chunk at debug; uploadFileChunks reports it once per file)
+        if (responseData.actualFilename && responseData.actualFilename !== fileName &&
+            responseData.actualFilename !== path.basename(fileName)) {
+          this.logger.debug(`Server used filename: ${responseData.actualFilename} (client sent: ${fileName})`);
         }
       } else {
         // Backward compatibility: plain text response
@@ -819,38 +1581,11 @@ class IndexedCPClient {
   async bufferAndUpload(filePath, serverUrl) {
     const apiKey = await this.getApiKey();
     const db = await this.initDB();
+    const chunks = await this.buildChunkRecords(filePath);
 
-    return new Promise((resolve, reject) => {
-      const readStream = fs.createReadStream(filePath, { highWaterMark: 1024 * 1024 }); // 1MB chunks
-      let chunkIndex = 0;
-
-      readStream.on('data', async (chunk) => {
-        try {
-          await db.add(this.storeName, { id: chunkIndex, data: chunk });
-          chunkIndex++;
-        } catch (error) {
-          reject(error);
-        }
-      });
-
-      readStream.on('end', async () => {
-        try {
-          for (let i = 0; i < chunkIndex; i++) {
-            const record = await db.get(this.storeName, i);
-            if (record) {
-              await this.uploadChunk(serverUrl, record.data, i, filePath, apiKey);
-              await db.delete(this.storeName, i);
-            }
-          }
-          this.logger.info('Upload complete.');
-          resolve();
-        } catch (error) {
-          reject(error);
-        }
-      });
-
-      readStream.on('error', reject);
-    });
+    await this.addChunkRecords(db, chunks);
+    await this.uploadFileChunks(serverUrl, filePath, chunks, db, apiKey);
+    this.logger.info('Upload complete.');
   }
 
   // ============================================================================
@@ -907,6 +1642,76 @@ class IndexedCPClient {
     }
   }
 
+  /**
+   * Delay before retrying a failed chunk or packet.
+   * The first retry is immediate. Later retries wait a random time between
+   * initialRetryDelay and the capped exponential delay, so chunks that failed
+   * together (e.g. while the server was down) do not all retry in lockstep.
+   * Errors that a retry cannot fix (4xx) are parked at maxRetryDelay.
+   * @param {number} retryCount - Attempts made so far (including the failed one)
+   * @param {Error} [error] - The error from the failed attempt
+   * @returns {number} Delay in milliseconds
+   */
+  computeRetryDelay(retryCount, error) {
+    if (error && !isRetryableError(error)) {
+      return this.maxRetryDelay;
+    }
+    
+    if (retryCount <= 1) {
+      return 0;
+    }
+    
+    const cap = Math.min(
+      this.initialRetryDelay * Math.pow(this.retryMultiplier, retryCount - 1),
+      this.maxRetryDelay
+    );
+    return this.initialRetryDelay + Math.random() * Math.max(0, cap - this.initialRetryDelay);
+  }
+
+  /**
+   * Whether a buffered chunk or packet is due for another attempt. Sets up
+   * its retryMetadata on first sight.
+   * @private
+   */
+  _isReadyForRetry(record, now, kind) {
+    if (!record.retryMetadata) {
+      record.retryMetadata = {
+        retryCount: 0,
+        lastAttempt: null,
+        nextRetry: now,
+        errors: []
+      };
+    }
+    
+    if (record.retryMetadata.nextRetry > now) {
+      return false;
+    }
+    
+    if (record.retryMetadata.retryCount >= this.maxRetries) {
+      this.logger.warn(`⚠ Max retries (${this.maxRetries}) reached for ${kind} ${record.id}`);
+      return false;
+    }
+    
+    return true;
+  }
+
+  /**
+   * Schedule the next attempt after a failed one (jittered exponential
+   * backoff) and keep the last few errors
+   * @private
+   * @returns {number} Delay until the next attempt, in milliseconds
+   */
+  _recordRetryFailure(record, error, now) {
+    const metadata = record.retryMetadata;
+    const delay = this.computeRetryDelay(metadata.retryCount, error);
+    metadata.nextRetry = now + delay;
+    metadata.errors.push({ timestamp: now, message: error.message });
+    if (metadata.errors.length > RETRY_ERROR_HISTORY) {
+      metadata.errors.shift();
+    }
+    return delay;
+  }
+
   /**
    * Process pending uploads with retry logic (internal)
    * @private
@@ -954,24 +1759,7 @@ class IndexedCPClient {
     // Group by fileName
     const fileGroups = {};
     allRecords.forEach(record => {
-      // Initialize retry metadata if not present
-      if (!record.retryMetadata) {
-        record.retryMetadata = {
-          retryCount: 0,
-          lastAttempt: null,
-          nextRetry: now,
-          errors: []
-        };
-      }
-      
-      // Check if ready for retry
-      if (record.retryMetadata.nextRetry > now) {
-        return; // Not ready yet
-      }
-      
-      // Check max retries
-      if (record.retryMetadata.retryCount >= this.maxRetries) {
-        this.logger.warn(`⚠ Max retries (${this.maxRetries}) reached for chunk ${record.id}`);
+      if (!this._isReadyForRetry(record, now, 'chunk')) {
         return;
       }
       
@@ -988,13 +1776,13 @@ class IndexedCPClient {
     
     this.logger.info(`📤 Background upload: ${fileCount} file(s) with pending chunks`);
     
-    // Upload files in parallel
-    const uploadPromises = Object.entries(fileGroups).map(([fileName, chunks]) =>
-      this._uploadFileChunksWithRetry(serverUrl, fileName, chunks, db, apiKey, now)
+    // Upload files in parallel, bounded by this.parallelism
+    const results = await mapSettledWithConcurrency(
+      Object.entries(fileGroups),
+      this.parallelism,
+      ([fileName, chunks]) => this._uploadFileChunksWithRetry(serverUrl, fileName, chunks, db, apiKey, now)
     );
     
-    const results = await Promise.allSettled(uploadPromises);
-    
     // Report results
     const succeeded = results.filter(r => r.status === 'fulfilled').length;
     const failed = results.filter(r => r.status === 'rejected').length;
@@ -1014,18 +1802,38 @@ class IndexedCPClient {
     
     const errors = [];
     let successCount = 0;
+    let nextRetryIn = Infinity;
+    // Chunks the server has; removed from the buffer after the pass
+    const uploadedIds = [];
+    
+    const { fileSize, chunkSize, fileSha256 } = chunks[0];
+    const received = await this.getReceivedChunks(serverUrl, fileName, apiKey, { fileSize, chunkSize, fileSha256 });
+    const compressionState = {};
     
     for (const chunk of chunks) {
+      if (received.has(chunk.chunkIndex)) {
+        // Already on the server from an earlier attempt
+        uploadedIds.push(chunk.id);
+        successCount++;
+        continue;
+      }
+      
       try {
         // Update retry metadata
         chunk.retryMetadata.lastAttempt = now;
         chunk.retryMetadata.retryCount++;
         
         // Attempt upload
-        const response = await this.uploadChunk(serverUrl, chunk.data, chunk.chunkIndex, fileName, apiKey);
-        
-        // Success - delete from DB
-        await db.delete(this.storeName, chunk.id);
+        const { body, contentEncoding } = await this.encodeChunk(serverUrl, chunk.data, compressionState);
+        const response = await this.uploadChunk(serverUrl, body, chunk.chunkIndex, fileName, apiKey, {
+          totalChunks: chunk.totalChunks,
+          fileSize,
+          chunkSize,
+          fileSha256,
+          contentEncoding
+        });
+        received.add(chunk.chunkIndex);
+        uploadedIds.push(chunk.id);
         successCount++;
         
         if (this.onUploadProgress) {
@@ -1037,29 +1845,16 @@ class IndexedCPClient {
           });
         }
       } catch (error) {
-        // Failure - update retry metadata with exponential backoff
-        const delay = Math.min(
-          this.initialRetryDelay * Math.pow(this.retryMultiplier, chunk.retryMetadata.retryCount - 1),
-          this.maxRetryDelay
-        );
-        
-        chunk.retryMetadata.nextRetry = now + delay;
-        chunk.retryMetadata.errors.push({
-          timestamp: now,
-          message: error.message
-        });
-        
-        // Keep only last 5 errors
-        if (chunk.retryMetadata.errors.length > 5) {
-          chunk.retryMetadata.errors.shift();
-        }
+        const delay = this._recordRetryFailure(chunk, error, now);
         
         // Update chunk in DB with new retry metadata
         await db.put(this.storeName, chunk);
         
         errors.push(error);
+        nextRetryIn = Math.min(nextRetryIn, delay);
         
-        this.logger.warn(`⚠ Upload failed for ${fileName} chunk ${chunk.chunkIndex} (retry ${chunk.retryMetadata.retryCount}/${this.maxRetries === Infinity ? '∞' : this.maxRetries}). Next retry in ${Math.round(delay/1000)}s`);
+        // Per chunk at debug; one warning per file is logged after the pass
+        this.logger.debug(`Upload failed for ${fileName} chunk ${chunk.chunkIndex} (retry ${chunk.retryMetadata.retryCount}/${this.maxRetries === Infinity ? '∞' : this.maxRetries}). Next retry in ${Math.round(delay/1000)}s`);
         
         if (this.onUploadProgress) {
           this.onUploadProgress({
@@ -1074,10 +1869,18 @@ class IndexedCPClient {
       }
     }
     
+    // After a checksum mismatch the whole file stays buffered: the server
+    // has dropped what it received
+    if (uploadedIds.length > 0 && !errors.some(isChecksumMismatch)) {
+      await this.deleteChunkRecords(db, uploadedIds);
+    }
+    
     if (errors.length > 0) {
+      this.logger.warn(`⚠ Upload failed for ${errors.length} chunk(s) of ${fileName} (${errors[0].message}). Next retry in ${Math.round(nextRetryIn/1000)}s`);
       throw new Error(`${errors.length} chunk(s) failed for ${fileName}`);
     }
     
+    this.receivedChunksCache.delete(`${serverUrl}\n${fileName}`);
     this.logger.info(`✓ Successfully uploaded ${fileName} (${successCount} chunks)`);
   }
 
@@ -1095,28 +1898,7 @@ class IndexedCPClient {
         return false;
       }
       
-      // Initialize retry metadata if not present
-      if (!packet.retryMetadata) {
-        packet.retryMetadata = {
-          retryCount: 0,
-          lastAttempt: null,
-          nextRetry: now,
-          errors: []
-        };
-      }
-      
-      // Check if ready for retry
-      if (packet.retryMetadata.nextRetry > now) {
-        return false;
-      }
-      
-      // Check max retries
-      if (packet.retryMetadata.retryCount >= this.maxRetries) {
-        this.logger.warn(`⚠ Max retries (${this.maxRetries}) reached for packet ${packet.id}`);
-        return false;
-      }
-      
-      return true;
+      return this._isReadyForRetry(packet, now, 'packet');
     });
     
     if (retryablePackets.length === 0) {
@@ -1134,13 +1916,13 @@ class IndexedCPClient {
     
     this.logger.info(`📤 Background upload: ${Object.keys(sessionGroups).length} session(s) with ${retryablePackets.length} pending packets`);
     
-    // Upload sessions in parallel
-    const uploadPromises = Object.entries(sessionGroups).map(([sessionId, sessionPackets]) =>
-      this._uploadSessionWithRetry(serverUrl, sessionId, sessionPackets, db, apiKey, now)
+    // Upload sessions in parallel, bounded by this.parallelism
+    const results = await mapSettledWithConcurrency(
+      Object.entries(sessionGroups),
+      this.parallelism,
+      ([sessionId, sessionPackets]) => this._uploadSessionWithRetry(serverUrl, sessionId, sessionPackets, db, apiKey, now)
     );
     
-    const results = await Promise.allSettled(uploadPromises);
-    
     // Report results
     const succeeded = results.filter(r => r.status === 'fulfilled').length;
     const failed = results.filter(r => r.status === 'rejected').length;
@@ -1167,6 +1949,7 @@ class IndexedCPClient {
     
     const errors = [];
     let successCount = 0;
+    let nextRetryIn = Infinity;
     
     for (const packet of sessionPackets) {
       try {
@@ -1178,29 +1961,33 @@ class IndexedCPClient {
         const payload = {
           sessionId: packet.sessionId,
           kid: session.kid,
-          wrappedKey: Buffer.from(session.wrappedKey).toString('base64'),
-          ciphertext: Buffer.from(packet.ciphertext).toString('base64'),
-          iv: Buffer.from(packet.iv).toString('base64'),
-          authTag: Buffer.from(packet.authTag).toString('base64'),
-          aad: Buffer.from(packet.aad).toString('base64'),
+          wrappedKey: toBase64(session.wrappedKey),
+          ciphertext: toBase64(packet.ciphertext),
+          iv: toBase64(packet.iv),
+          authTag: toBase64(packet.authTag),
+          aad: toBase64(packet.aad),
           seq: packet.seq,
           fileName: session.fileName
         };
         
-        const response = await fetch(`${serverUrl}/upload-encrypted`, {
+        const response = await this.fetchUpload(`${serverUrl}/upload-encrypted`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
             'Authorization': `Bearer ${apiKey}`
           },
-          body: JSON.stringify(payload)
+          body: JSON.stringify(payload),
+          agent: this.agent
         });
         
         if (!response.ok) {
-          throw new Error(`Upload failed: ${response.statusText}`);
+          const error = new Error(`Upload failed: ${response.statusText}`);
+          error.status = response.status;
+          throw error;
         }
         
         // Success - mark as uploaded
+        const { retryCount } = packet.retryMetadata;
         packet.status = 'uploaded';
         delete packet.retryMetadata; // Clean up metadata
         await db.put('packets', packet);
@@ -1212,35 +1999,21 @@ class IndexedCPClient {
             fileName: session.fileName,
             seq: packet.seq,
             status: 'success',
-            retryCount: packet.retryMetadata.retryCount - 1
+            retryCount: retryCount - 1
           });
         }
       } catch (error) {
-        // Failure - update retry metadata with exponential backoff
-        const delay = Math.min(
-          this.initialRetryDelay * Math.pow(this.retryMultiplier, packet.retryMetadata.retryCount - 1),
-          this.maxRetryDelay
-        );
-        
-        packet.retryMetadata.nextRetry = now + delay;
-        packet.retryMetadata.errors.push({
-          timestamp: now,
-          message: error.message
-        });
-        
-        // Keep only last 5 errors
-        if (packet.retryMetadata.errors.length > 5) {
-          packet.retryMetadata.errors.shift();
-        }
-        
+        const delay = this._recordRetryFailure(packet, error, now);
         packet.status = 'failed';
         
         // Update packet in DB with new retry metadata
         await db.put('packets', packet);
         
         errors.push(error);
+        nextRetryIn = Math.min(nextRetryIn, delay);
         
-        this.logger.warn(`⚠ Upload failed for ${session.fileName} packet ${packet.seq} (retry ${packet.retryMetadata.retryCount}/${this.maxRetries === Infinity ? '∞' : this.maxRetries}). Next retry in ${Math.round(delay/1000)}s`);
+        // Per packet at debug; one warning per session is logged after the pass
+        this.logger.debug(`Upload failed for ${session.fileName} packet ${packet.seq} (retry ${packet.retryMetadata.retryCount}/${this.maxRetries === Infinity ? '∞' : this.maxRetries}). Next retry in ${Math.round(delay/1000)}s`);
         
         if (this.onUploadProgress) {
           this.onUploadProgress({
@@ -1262,6 +2035,7 @@ class IndexedCPClient {
       this.sessionSeqCounters.delete(sessionId);
       this.logger.info(`✓ Successfully uploaded ${session.fileName} (${successCount} packets)`);
     } else {
+      this.logger.warn(`⚠ Upload failed for ${errors.length} packet(s) of ${session.fileName} (${errors[0].message}). Next retry in ${Math.round(nextRetryIn/1000)}s`);
       throw new Error(`${errors.length} packet(s) failed for ${session.fileName}`);
     }
   }
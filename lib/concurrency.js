@@ -0,0 +1,82 @@
+/**
+ * Run an async function over a list of items with at most `limit` calls in flight.
+ * Results are returned in input order, like Promise.all.
+ * @param {Array} items - Items to process
+ * @param {number} limit - Maximum number of concurrent calls
+ * @param {Function} fn - Async function called as fn(item, index)
+ * @returns {Promise<Array>} Results in input order
+ */
+async function mapWithConcurrency(items, limit, fn) {
+  const results = new Array(items.length);
+  const workerCount = Math.max(1, Math.min(limit || 1, items.length));
+  let next = 0;
+
+  async function worker() {
+    while (next < items.length) {
+      const index = next++;
+      results[index] = await fn(items[index], index);
+    }
+  }
+
+  const workers = [];
+  for (let i = 0; i < workerCount; i++) {
+    workers.push(worker());
+  }
+  await Promise.all(workers);
+
+  return results;
+}
+
+/**
+ * Like mapWithConcurrency, but never rejects: each result is a
+ * { status, value | reason } record, like Promise.allSettled.
+ * @param {Array} items - Items to process
+ * @param {number} limit - Maximum number of concurrent calls
+ * @param {Function} fn - Async function called as fn(item, index)
+ * @returns {Promise<Array>} Settled results in input order
+ */
+function mapSettledWithConcurrency(items, limit, fn) {
+  return mapWithConcurrency(items, limit, async (item, index) => {
+    try {
+      return { status: 'fulfilled', value: await fn(item, index) };
+    } catch (reason) {
+      return { status: 'rejected', reason };
+    }
+  });
+}
+
+/**
+ * Create a limiter that runs at most `limit` async functions at once, no
+ * matter how many callers share it. Excess calls wait in FIFO order.
+ * @param {number} limit - Maximum number of concurrent calls
+ * @returns {Function} run(fn) - Calls fn() when a slot is free, resolves with its result
+ */
+function createLimiter(limit) {
+  const max = Math.max(1, limit || 1);
+  const waiting = [];
+  let active = 0;
+
+  function release() {
+    if (waiting.length > 0) {
+      // Hand the slot straight to the next caller
+      waiting.shift()();
+    } else {
+      active--;
+    }
+  }
+
+  return async function run(fn) {
+    if (active < max) {
+      active++;
+    } else {
+      await new Promise(resolve => waiting.push(resolve));
+    }
+    try {
+      return await fn();
+    } finally {
+      release();
+    }
+  };
+}
+
+module.exports = { mapWithConcurrency, mapSettledWithConcurrency, createLimiter };
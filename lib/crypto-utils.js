@@ -112,23 +112,26 @@ class CryptoUtils {
     // Generate unique IV for this packet
     const iv = crypto.randomBytes(this.IV_LENGTH);
     
-    // Prepare AAD (Additional Authenticated Data)
-    const aad = Buffer.from(JSON.stringify({
+    // Prepare AAD (Additional Authenticated Data). Packets are stored with
+    // their AAD and ciphertext, so both get exactly-sized buffers rather than
+    // views into Node's shared 8 KiB pool, which would be cloned whole.
+    const aadJson = JSON.stringify({
       sessionId: metadata.sessionId,
       seq: metadata.seq,
       codec: metadata.codec || 'raw',
       timestamp: metadata.timestamp || Date.now()
-    }));
+    });
+    const aad = Buffer.allocUnsafeSlow(Buffer.byteLength(aadJson));
+    aad.write(aadJson);
 
     // Create cipher
     const cipher = crypto.createCipheriv('aes-256-gcm', sessionKey, iv);
     cipher.setAAD(aad);
 
-    // Encrypt
-    const ciphertext = Buffer.concat([
-      cipher.update(data),
-      cipher.final()
-    ]);
+    // Encrypt. GCM is a stream mode: update() returns all the ciphertext
+    // and final() only computes the tag.
+    const ciphertext = cipher.update(data);
+    cipher.final();
 
     // Get authentication tag
     const authTag = cipher.getAuthTag();
@@ -0,0 +1,190 @@
+const fs = require('fs');
+const { Writable } = require('stream');
+
+/**
+ * Keeps FileHandles open between requests for the same file, so a
+ * multi-chunk upload pays one open()/close() pair instead of one per chunk.
+ * Append-mode and positional handles are cached separately: under O_APPEND
+ * the offset of a positional write is ignored, and without it an append
+ * would write at offset 0. A handle is closed once it has been idle for
+ * `idleTimeout` ms, when more than `limit` files are open (least recently
+ * used idle handle first), or on close()/closeAll().
+ */
+class FileHandleCache {
+  constructor({ limit = 64, idleTimeout = 30000 } = {}) {
+    this.limit = limit;
+    this.idleTimeout = idleTimeout;
+    this.entries = new Map(); // entryKey() -> { opening, handle, users, timer } (oldest first)
+  }
+
+  /**
+   * Get an open handle for filePath, opening it on first use. Each successful
+   * acquire() must be paired with release(filePath, handle).
+   * @param {string} filePath
+   * @param {number} [size] - Final size, if known: the file is opened for
+   *   positional writes and set to this length once, instead of appended to
+   * @returns {Promise<fs.promises.FileHandle>}
+   */
+  acquire(filePath, size) {
+    const key = entryKey(filePath, size !== undefined);
+    let entry = this.entries.get(key);
+    if (entry) {
+      // Re-insert to mark it most recently used
+      this.entries.delete(key);
+      clearTimeout(entry.timer);
+      entry.timer = null;
+    } else {
+      entry = { opening: null, handle: null, users: 0, timer: null };
+      entry.opening = openFile(filePath, size).then((handle) => {
+        entry.handle = handle;
+        return handle;
+      }, (error) => {
+        this.forget(key, entry);
+        throw error;
+      });
+    }
+    entry.users++;
+    this.entries.set(key, entry);
+    this.evict();
+    return entry.opening;
+  }
+
+  /**
+   * Give back a handle obtained from acquire()
+   * @param {string} filePath
+   * @param {fs.promises.FileHandle} handle
+   */
+  release(filePath, handle) {
+    for (const key of [entryKey(filePath, false), entryKey(filePath, true)]) {
+      const entry = this.entries.get(key);
+      if (entry && entry.handle === handle) {
+        entry.users--;
+        if (entry.users === 0) {
+          entry.timer = setTimeout(() => this.closeEntry(key), this.idleTimeout);
+          entry.timer.unref();
+        }
+        return;
+      }
+    }
+  }
+
+  /**
+   * Close the handles for filePath unless a request is still writing to them
+   * (the idle timeout closes them later in that case)
+   * @param {string} filePath
+   */
+  async close(filePath) {
+    await Promise.all([this.closeEntry(entryKey(filePath, false)), this.closeEntry(entryKey(filePath, true))]);
+  }
+
+  async closeEntry(key) {
+    const entry = this.entries.get(key);
+    if (!entry || entry.users > 0) {
+      return;
+    }
+    this.forget(key, entry);
+    await entry.opening.then((handle) => handle.close()).catch(() => {});
+  }
+
+  /**
+   * Close every handle, including ones still in use
+   */
+  async closeAll() {
+    const entries = [...this.entries.values()];
+    for (const entry of entries) {
+      clearTimeout(entry.timer);
+    }
+    this.entries.clear();
+    await Promise.all(entries.map((entry) => entry.opening.then((handle) => handle.close()).catch(() => {})));
+  }
+
+  forget(key, entry) {
+    clearTimeout(entry.timer);
+    if (this.entries.get(key) === entry) {
+      this.entries.delete(key);
+    }
+  }
+
+  evict() {
+    for (const [key, entry] of this.entries) {
+      if (this.entries.size <= this.limit) {
+        break;
+      }
+      if (entry.users === 0) {
+        this.closeEntry(key);
+      }
+    }
+  }
+}
+
+function entryKey(filePath, positional) {
+  return `${positional ? 'positional' : 'append'}:${filePath}`;
+}
+
+async function openFile(filePath, size) {
+  if (size === undefined) {
+    return fs.promises.open(filePath, 'a');
+  }
+  
+  // O_APPEND would send every positional write to the end of the file
+  const handle = await fs.promises.open(filePath, fs.constants.O_WRONLY | fs.constants.O_CREAT);
+  try {
+    // Setting the length once saves an inode size update per chunk (and
+    // discards anything left over from an earlier, longer file)
+    await handle.truncate(size);
+  } catch (error) {
+    await handle.close();
+    throw error;
+  }
+  return handle;
+}
+
+/**
+ * Writable that writes to a cached handle. Unlike fs.createWriteStream({ fd })
+ * it never closes (or holds a reference on) the handle, so a failed or
+ * aborted chunk leaves it usable for the next one. Buffered writes are
+ * flushed with a single writev().
+ * @param {fs.promises.FileHandle} handle
+ * @param {number} [highWaterMark]
+ * @param {number|null} [position] - Offset to write at; null appends
+ * @returns {Writable}
+ */
+function createHandleWriteStream(handle, highWaterMark, position = null) {
+  const writeBuffers = (buffers, callback) => {
+    writeAll(handle, buffers, position).then((written) => {
+      if (position !== null) {
+        position += written;
+      }
+      callback();
+    }, callback);
+  };
+  
+  return new Writable({
+    highWaterMark,
+    write(chunk, encoding, callback) {
+      writeBuffers([chunk], callback);
+    },
+    writev(chunks, callback) {
+      writeBuffers(chunks.map(({ chunk }) => chunk), callback);
+    }
+  });
+}
+
+async function writeAll(handle, buffers, position) {
+  let written = 0;
+  // writev() may write less than asked for; retry with the remainder
+  while (buffers.length > 0) {
+    let { bytesWritten } = await handle.writev(buffers, position === null ? null : position + written);
+    written += bytesWritten;
+    while (buffers.length > 0 && bytesWritten >= buffers[0].length) {
+      bytesWritten -= buffers[0].length;
+      buffers.shift();
+    }
+    if (bytesWritten > 0) {
+      buffers[0] = buffers[0].subarray(bytesWritten);
+    }
+  }
+  return written;
+}
+
+module.exports = { FileHandleCache, createHandleWriteStream };
@@ -1,5 +1,9 @@
 const log = require('console-log-level');
 
+const LEVELS = ['trace', 'debug', 'info', 'warn', 'error', 'fatal'];
+
+function noop() {}
+
 /**
  * Create a logger instance with the specified log level
  * @param {Object} options - Logger options
@@ -13,13 +17,15 @@ function createLogger(options = {}) {
   
   const logger = log({ level });
   
-  // If a prefix is provided, wrap the logger methods to include it
+  // If a prefix is provided, wrap the logger methods to include it. Levels
+  // below the configured one become no-ops, so per-chunk debug calls on the
+  // upload path cost nothing when debug output is off.
   if (prefix) {
     const wrappedLogger = {};
-    ['trace', 'debug', 'info', 'warn', 'error', 'fatal'].forEach(method => {
-      wrappedLogger[method] = (...args) => {
-        logger[method](prefix, ...args);
-      };
+    LEVELS.forEach(method => {
+      wrappedLogger[method] = LEVELS.indexOf(method) >= LEVELS.indexOf(level)
+        ? (...args) => logger[method](prefix, ...args)
+        : noop;
     });
     return wrappedLogger;
   }
@@ -2,13 +2,54 @@ const http = require('http');
 const fs = require('fs');
 const path = require('path');
 const crypto = require('crypto');
+const zlib = require('zlib');
+const { pipeline, Transform } = require('stream');
 const { createLogger } = require('./logger');
+const { FileHandleCache, createHandleWriteStream } = require('./file-handle-cache');
+const { ChunkBitmap } = require('./chunk-bitmap');
+
+// Write buffer for chunk files. Socket reads arrive in ~16-64 KB pieces; with
+// room to queue them while a write is in flight, the write stream flushes the
+// backlog with a single writev() instead of one write() per piece.
+const WRITE_HIGH_WATER_MARK = 1024 * 1024;
+
+// Received-chunk bitmaps are sized from X-Total-Chunks up to this many chunks
+// (128 KB); larger uploads grow the bitmap as chunks arrive
+const MAX_PREALLOCATED_CHUNKS = 1 << 20;
+
+// Most chunks a single upload may declare (a 2 MB bitmap), unless raised with
+// the maxChunksPerUpload option
+const DEFAULT_MAX_CHUNKS_PER_UPLOAD = 1 << 24;
+
+// Partial uploads that receive no chunk for this long are forgotten (a client
+// that comes back later starts over), unless set with uploadIdleTimeout
+const DEFAULT_UPLOAD_IDLE_TIMEOUT = 24 * 60 * 60 * 1000;
+
+// Content-Encodings accepted on chunk bodies. zstd decompresses several times
+// faster than gzip at a similar ratio, but needs a Node with zlib zstd support
+// (22.15+/23.8+); it is listed first so clients that can send it prefer it.
+const CHUNK_DECODERS = {
+  ...(typeof zlib.createZstdDecompress === 'function' ? { zstd: () => zlib.createZstdDecompress() } : {}),
+  gzip: () => zlib.createGunzip()
+};
+const ACCEPT_ENCODING = Object.keys(CHUNK_DECODERS).join(', ');
+
+// CORS headers for browser clients, sent with every response. Kept as a flat
+// [name, value, ...] list so writeHead() takes them as-is instead of each
+// response building them up with setHeader() calls.
+const CORS_HEADERS = [
+  'Access-Control-Allow-Origin', '*',
+  'Access-Control-Allow-Methods', 'GET, POST, OPTIONS',
+  'Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Chunk-Index, X-File-Name, X-Total-Chunks, X-Chunk-Count, X-File-Size, X-Chunk-Size, X-File-SHA256, Content-Encoding'
+];
 
 class IndexedCPServer {
   constructor(options = {}) {
     this.outputDir = options.outputDir || process.cwd();
     this.port = options.port || 3000;
     this.apiKey = options.apiKey || this.generateApiKey();
+    // Whole expected Authorization header, compared in constant time
+    this.authorizationBuffer = Buffer.from(`Bearer ${this.apiKey}`);
     this.filenameGenerator = options.filenameGenerator || null; // Optional custom filename generator
     
     // Logger configuration
@@ -23,8 +64,45 @@ class IndexedCPServer {
     // 'allow-paths' - Allow client to create subdirectories
     this.pathMode = options.pathMode || 'ignore';
     
+    // In allow-paths mode, let an upload replace an existing file of the same
+    // name (sized and written in place) instead of appending to it
+    this.overwrite = options.overwrite || false;
+    
     // Track filenames across chunks for the same upload session
-    this.uploadSessions = new Map(); // clientFileName -> actualFileName
+    this.uploadSessions = new Map(); // upload key (see uploadKey) -> actualFileName
+    
+    // Track received chunk indexes for resumable uploads. Only uploads that
+    // send X-Total-Chunks are tracked; the entry is dropped once complete.
+    this.chunkUploads = new Map(); // upload key -> { actualFileName, totalChunks, received: ChunkBitmap }
+    this.maxChunksPerUpload = options.maxChunksPerUpload || DEFAULT_MAX_CHUNKS_PER_UPLOAD;
+    
+    // Abandoned uploads would otherwise be tracked for the life of the process;
+    // a periodic sweep (started with the HTTP server) drops idle ones
+    this.uploadIdleTimeout = options.uploadIdleTimeout || DEFAULT_UPLOAD_IDLE_TIMEOUT;
+    this.uploadSweepTimer = null;
+    
+    // Largest body a client should build by coalescing consecutive chunks into
+    // one request (X-Chunk-Count); advertised on /upload/status. Also caps the
+    // (decompressed) body of a chunk sent without X-File-Size/X-Chunk-Size.
+    this.maxRequestSize = options.maxRequestSize || 16 * 1024 * 1024;
+    
+    // Set once outputDir is known to exist (see ensureOutputDir)
+    this.outputDirReady = false;
+    
+    // Subdirectories already created in allow-paths mode, so later chunks
+    // skip the existsSync/mkdirSync check; cleared on each idle sweep so it
+    // only holds directories of recent uploads
+    this.createdDirs = new Set();
+    
+    // Output files stay open between chunks; closed when an upload completes,
+    // after going idle, or when too many are open
+    this.openFiles = new FileHandleCache({ limit: options.maxOpenFiles || 64 });
+    
+    // Optional cap on open client connections (env: INDEXEDCP_MAX_CONNECTIONS).
+    // It bounds the sockets, buffers and file handles a flood of clients can
+    // tie up; connections past it are dropped, so it is off by default.
+    this.maxConnections = options.maxConnections ||
+      parseInt(process.env.INDEXEDCP_MAX_CONNECTIONS, 10) || null;
     
     // Encryption support (optional)
     this.encryption = options.encryption || false;
@@ -262,15 +340,215 @@ class IndexedCPServer {
   // End Encryption Methods
   // ============================================================================
 
+  // ============================================================================
+  // Chunk Tracking (resumable uploads)
+  // ============================================================================
+
+  /**
+   * Check whether a chunk of a tracked upload has already been written
+   */
+  isChunkReceived(key, chunkIndex) {
+    const upload = this.chunkUploads.get(key);
+    return upload ? upload.received.has(chunkIndex) : false;
+  }
+
+  /**
+   * Get (or start) the tracking record for an upload
+   */
+  getChunkUpload(key, totalChunks, actualFileName) {
+    let upload = this.chunkUploads.get(key);
+    if (!upload) {
+      upload = {
+        actualFileName,
+        totalChunks,
+        // One bit per chunk, sized from X-Total-Chunks
+        received: new ChunkBitmap(Math.min(totalChunks, MAX_PREALLOCATED_CHUNKS)),
+        // Running SHA-256 of the file, fed while chunks arrive in order
+        sha256: crypto.createHash('sha256'),
+        hashedChunks: 0,
+        expectedSha256: null,
+        // Whether chunks are written at their offsets (see isPositionalUpload),
+        // and the promise of that decision, made once on the first chunk
+        positional: false,
+        positionalDecision: null,
+        lastActivity: 0
+      };
+      this.chunkUploads.set(key, upload);
+    }
+    upload.lastActivity = Date.now();
+    return upload;
+  }
+
+  /**
+   * Forget partial uploads that have not received a chunk within
+   * uploadIdleTimeout. Their files stay on disk. Also forgets which
+   * subdirectories were created, so that set does not grow without bound.
+   */
+  sweepIdleUploads(now = Date.now()) {
+    this.createdDirs.clear();
+    for (const [key, upload] of this.chunkUploads) {
+      if (now - upload.lastActivity >= this.uploadIdleTimeout) {
+        this.chunkUploads.delete(key);
+        this.uploadSessions.delete(key);
+        this.logger.info(`Dropped idle upload ${upload.actualFileName} ` +
+          `(${upload.received.size}/${upload.totalChunks} chunks)`);
+      }
+    }
+  }
+
+  /**
+   * Get a copy of the running file hash for a request whose chunk is the next
+   * one in order; the request hashes its body into the copy, and
+   * commitChunkHash() adopts it once the body is on disk. A failed or aborted
+   * body thus never reaches the file hash. Once a chunk arrives out of order
+   * the running hash is dropped, and verifyUpload() hashes the finished file.
+   */
+  getChunkHash(upload, chunkIndex) {
+    if (upload.sha256 && chunkIndex !== upload.hashedChunks) {
+      upload.sha256 = null;
+    }
+    return upload.sha256 ? upload.sha256.copy() : null;
+  }
+
+  /**
+   * Adopt a request's hash (from getChunkHash) after its chunks were written.
+   * Only the first copy to finish for a position counts: a concurrent
+   * duplicate of the same chunk finds the upload already past it.
+   */
+  commitChunkHash(upload, chunkIndex, chunkCount, hash) {
+    if (upload.sha256 && chunkIndex === upload.hashedChunks) {
+      upload.sha256 = hash;
+      upload.hashedChunks += chunkCount;
+    }
+  }
+
+  /**
+   * Record a written chunk (or `count` consecutive chunks starting at
+   * chunkIndex). Returns the upload record when this completes the upload, in
+   * which case tracking (and the filename session) for it is released;
+   * otherwise null.
+   */
+  markChunkReceived(key, chunkIndex, totalChunks, actualFileName, count = 1) {
+    const upload = this.getChunkUpload(key, totalChunks, actualFileName);
+    upload.received.addRange(chunkIndex, chunkIndex + count);
+    
+    if (upload.received.size >= upload.totalChunks) {
+      this.chunkUploads.delete(key);
+      this.uploadSessions.delete(key);
+      return upload;
+    }
+    return null;
+  }
+
+  /**
+   * Check a completed upload against the X-File-SHA256 digest the client sent,
+   * using the running hash when every chunk arrived in order and otherwise
+   * reading the finished file back. Resolves false only on a definite
+   * mismatch; uploads without a digest pass, and appended uploads whose
+   * chunks arrived out of order pass unverified (the file may hold more than
+   * the upload).
+   * @returns {Promise<boolean>}
+   */
+  async verifyUpload(upload, outputFile) {
+    if (!upload.expectedSha256) {
+      return true;
+    }
+    const expected = upload.expectedSha256.toLowerCase();
+    if (upload.sha256 && upload.hashedChunks === upload.totalChunks) {
+      return upload.sha256.digest('hex') === expected;
+    }
+    if (!upload.positional) {
+      this.logger.warn(`Upload ${upload.actualFileName} not verified: chunks were appended out of order`);
+      return true;
+    }
+    const hash = crypto.createHash('sha256');
+    for await (const data of fs.createReadStream(outputFile)) {
+      hash.update(data);
+    }
+    return hash.digest('hex') === expected;
+  }
+
+  /**
+   * Get the sorted chunk indexes received so far for an in-progress upload
+   * (the bitmap iterates in ascending order)
+   */
+  getReceivedChunks(key) {
+    const upload = this.chunkUploads.get(key);
+    return upload ? Array.from(upload.received) : [];
+  }
+
+  /**
+   * Handle GET /upload/status?filename=...[&size=...][&sha256=...] (authenticated)
+   * `size` and `sha256` are the X-File-Size and X-File-SHA256 the upload's
+   * chunks are sent with (see uploadKey).
+   * Clients that send Accept: application/vnd.indexcp.ranges+json get
+   * half-open [start, end) ranges instead of a list of every index.
+   */
+  handleStatusRequest(req, res) {
+    const clientFileName = getQueryParam(req.url, 'filename');
+    
+    if (!clientFileName) {
+      sendJson(res, 400, RESPONSES.missingFilename);
+      return;
+    }
+    
+    const key = uploadKey(clientFileName, getQueryParam(req.url, 'size'), getQueryParam(req.url, 'sha256'));
+    const upload = this.chunkUploads.get(key);
+    const accept = req.headers['accept'] || '';
+    const body = { filename: clientFileName };
+    
+    // Ranges come straight off the bitmap, without materializing every index
+    if (accept.includes('application/vnd.indexcp.ranges+json')) {
+      body.ranges = upload ? upload.received.toRanges() : [];
+    } else {
+      body.receivedChunks = this.getReceivedChunks(key);
+    }
+    
+    // Accept-Encoding on a response (RFC 7694) tells the client it may
+    // compress the chunks it sends; X-Max-Request-Size that it may coalesce them
+    sendJson(res, 200, body, [
+      'Accept-Encoding', ACCEPT_ENCODING,
+      'X-Max-Request-Size', String(this.maxRequestSize)
+    ]);
+  }
+
+  // ============================================================================
+  // End Chunk Tracking
+  // ============================================================================
+
+  /**
+   * Create outputDir if needed. Only the first call touches the filesystem,
+   * so uploads don't pay a blocking existsSync/mkdirSync pair per request;
+   * a write that fails with ENOENT (directory removed while running) resets
+   * the flag so the next request recreates it.
+   */
+  ensureOutputDir() {
+    if (!this.outputDirReady) {
+      fs.mkdirSync(this.outputDir, { recursive: true });
+      this.outputDirReady = true;
+    }
+  }
+
+  /**
+   * Check an Authorization header against `Bearer <apiKey>` in one
+   * constant-time comparison, so response timing doesn't reveal how much of
+   * a guessed key matched
+   */
+  isAuthorized(authHeader) {
+    if (!authHeader) {
+      return false;
+    }
+    const provided = Buffer.from(authHeader);
+    return provided.length === this.authorizationBuffer.length &&
+      crypto.timingSafeEqual(provided, this.authorizationBuffer);
+  }
+
   createServer() {
-    this.server = http.createServer((req, res) => {
-      // CORS headers for browser clients
-      res.setHeader('Access-Control-Allow-Origin', '*');
-      res.setHeader('Access-Control-Allow-Methods', 'GET, POST, OPTIONS');
-      res.setHeader('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Chunk-Index, X-File-Name');
-      
+    // Acks are small writes that must not wait on Nagle; keep-alive probes
+    // drop sockets left behind by clients that vanished mid-upload
+    this.server = http.createServer({ noDelay: true, keepAlive: true }, (req, res) => {
       if (req.method === 'OPTIONS') {
-        res.writeHead(200);
+        res.writeHead(200, CORS_HEADERS);
         res.end();
         return;
       }
@@ -282,76 +560,108 @@ class IndexedCPServer {
       }
 
       // Authenticate all other endpoints
-      const authHeader = req.headers['authorization'];
-      const providedApiKey = authHeader && authHeader.startsWith('Bearer ') 
-        ? authHeader.slice(7) 
-        : null;
-        
-      if (!providedApiKey || providedApiKey !== this.apiKey) {
-        res.writeHead(401, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ error: 'Invalid or missing API key' }));
+      if (!this.isAuthorized(req.headers['authorization'])) {
+        sendJson(res, 401, RESPONSES.unauthorized);
         return;
       }
 
       // Route requests
       if (req.method === 'POST' && req.url === '/upload') {
         this.handleUpload(req, res);
+      } else if (req.method === 'GET' && req.url.startsWith('/upload/status?')) {
+        this.handleStatusRequest(req, res);
       } else if (this.encryption && req.method === 'POST' && req.url === '/upload-encrypted') {
         this.handleEncryptedUpload(req, res);
       } else if (this.encryption && req.method === 'POST' && req.url === '/rotate-keys') {
         this.handleKeyRotation(req, res);
       } else {
-        res.writeHead(404);
+        res.writeHead(404, CORS_HEADERS);
         res.end('Not Found');
       }
     });
+    if (this.maxConnections) {
+      this.server.maxConnections = this.maxConnections;
+    }
+    
+    this.uploadSweepTimer = setInterval(() => this.sweepIdleUploads(),
+      Math.min(this.uploadIdleTimeout, 60 * 60 * 1000));
+    this.uploadSweepTimer.unref();
+    
+    // Requests sent with Expect: 100-continue wait for the go-ahead before
+    // sending a body. Uploads give it only once the body is actually needed,
+    // so a chunk the server already has is acknowledged without being sent.
+    this.server.on('checkContinue', (req, res) => {
+      if (req.method !== 'POST' || req.url !== '/upload') {
+        res.writeContinue();
+      }
+      this.server.emit('request', req, res);
+    });
 
     return this.server;
   }
 
+  /**
+   * Build a unique output filename for 'ignore' mode that still shows the
+   * client's full path: <timestamp>_<random>_<path-with-underscores>.<ext>
+   */
+  generateUniqueFileName(clientFileName) {
+    const timestamp = Date.now();
+    const random = crypto.randomBytes(4).toString('hex');
+    
+    // Preserve full path by replacing separators with single underscore
+    // Strip leading ./ or .\
+    let fullPath = clientFileName.replace(/^\.\//, '').replace(/^\.\\/, '');
+    
+    // Replace path separators with single underscore
+    fullPath = fullPath.replace(/[/\\]+/g, '_');
+    
+    // Extract extension
+    const ext = path.extname(fullPath);
+    const nameWithoutExt = fullPath.slice(0, fullPath.length - ext.length);
+    
+    // Sanitize to be filesystem-safe:
+    // - Keep letters, numbers, underscores (path markers), dots, and existing dashes
+    // - Replace all other characters with dash
+    const safeName = nameWithoutExt.replace(/[^a-zA-Z0-9._-]/g, '-');
+    
+    // Format: <timestamp>_<random>_<full-path-with-underscores>.<ext>
+    let proposedName = `${timestamp}_${random}_${safeName}${ext}`;
+    
+    // Check filename length (most filesystems support 255 chars)
+    const MAX_FILENAME_LENGTH = 255;
+    if (proposedName.length > MAX_FILENAME_LENGTH) {
+      // Truncate the safe name part to fit
+      const prefixLength = `${timestamp}_${random}_`.length;
+      const maxSafeNameLength = MAX_FILENAME_LENGTH - prefixLength - ext.length;
+      const truncatedName = safeName.slice(0, maxSafeNameLength);
+      proposedName = `${timestamp}_${random}_${truncatedName}${ext}`;
+    }
+    
+    return proposedName;
+  }
+
   handleUpload(req, res) {
-    const chunkIndex = req.headers['x-chunk-index'];
+    const chunkIndexHeader = req.headers['x-chunk-index'];
+    const chunkIndex = parseInt(chunkIndexHeader, 10);
     const clientFileName = req.headers['x-file-name'] || 'uploaded_file.txt';
+    const totalChunks = parseInt(req.headers['x-total-chunks'], 10);
+    const trackChunks = totalChunks > 0 && chunkIndex >= 0;
+    // A request may carry several consecutive chunks, starting at chunkIndex
+    const chunkCount = Math.max(1, parseInt(req.headers['x-chunk-count'], 10) || 1);
+    // Tracking is per file, not just per name: two clients uploading
+    // different files under one name get separate entries
+    const key = uploadKey(clientFileName, req.headers['x-chunk-size'] ? req.headers['x-file-size'] : null,
+      req.headers['x-file-sha256']);
     
     let outputFile;
     let actualFileName;
     
     // Handle different path modes
     if (this.pathMode === 'ignore') {
-      // Mode: 'ignore' - Generate unique filename with full path preserved
-      const timestamp = Date.now();
-      const random = crypto.randomBytes(4).toString('hex');
-      
-      // Preserve full path by replacing separators with single underscore
-      // Strip leading ./ or .\
-      let fullPath = clientFileName.replace(/^\.\//, '').replace(/^\.\\/, '');
-      
-      // Replace path separators with single underscore
-      fullPath = fullPath.replace(/[/\\]+/g, '_');
-      
-      // Extract extension
-      const ext = path.extname(fullPath);
-      const nameWithoutExt = fullPath.slice(0, fullPath.length - ext.length);
-      
-      // Sanitize to be filesystem-safe:
-      // - Keep letters, numbers, underscores (path markers), dots, and existing dashes
-      // - Replace all other characters with dash
-      const safeName = nameWithoutExt.replace(/[^a-zA-Z0-9._-]/g, '-');
-      
-      // Format: <timestamp>_<random>_<full-path-with-underscores>.<ext>
-      let proposedName = `${timestamp}_${random}_${safeName}${ext}`;
-      
-      // Check filename length (most filesystems support 255 chars)
-      const MAX_FILENAME_LENGTH = 255;
-      if (proposedName.length > MAX_FILENAME_LENGTH) {
-        // Truncate the safe name part to fit
-        const prefixLength = `${timestamp}_${random}_`.length;
-        const maxSafeNameLength = MAX_FILENAME_LENGTH - prefixLength - ext.length;
-        const truncatedName = safeName.slice(0, maxSafeNameLength);
-        proposedName = `${timestamp}_${random}_${truncatedName}${ext}`;
-      }
-      
-      actualFileName = proposedName;
+      // Mode: 'ignore' - Generate unique filename with full path preserved.
+      // Later chunks of a tracked upload keep the name picked for its first chunk.
+      const upload = this.chunkUploads.get(key);
+      actualFileName = upload ? upload.actualFileName : this.generateUniqueFileName(clientFileName);
       outputFile = path.join(this.outputDir, actualFileName);
       
     } else if (this.pathMode === 'allow-paths') {
@@ -367,11 +677,7 @@ class IndexedCPServer {
       
       if (hasTraversal || hasAbsolutePath) {
         this.logger.error(`Security: Rejected filename with traversal/absolute path: ${clientFileName}`);
-        res.writeHead(400, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ 
-          error: 'Invalid filename',
-          message: 'Filename must not contain traversal sequences or absolute paths'
-        }));
+        sendJson(res, 400, RESPONSES.traversalFilename);
         return;
       }
       
@@ -385,23 +691,29 @@ class IndexedCPServer {
       if (!resolvedOutputFile.startsWith(resolvedOutputDir + path.sep) && 
           resolvedOutputFile !== resolvedOutputDir) {
         this.logger.error(`Security: Path traversal attempt blocked: ${clientFileName}`);
-        res.writeHead(403, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ error: 'Access denied: invalid path' }));
+        sendJson(res, 403, RESPONSES.accessDenied);
         return;
       }
       
       // Create subdirectories if needed
       const outputFileDir = path.dirname(outputFile);
-      if (!fs.existsSync(outputFileDir)) {
+      if (!this.createdDirs.has(outputFileDir)) {
         fs.mkdirSync(outputFileDir, { recursive: true });
+        this.createdDirs.add(outputFileDir);
       }
       
+    } else if (this.uploadSessions.has(key)) {
+      // Mode: 'sanitize', later chunks - reuse the name validated and picked
+      // for the first chunk
+      actualFileName = this.uploadSessions.get(key);
+      outputFile = path.join(this.outputDir, actualFileName);
+      
     } else {
       // Mode: 'sanitize' (default) - Strip paths, prevent overwrites
       
       // Use custom generator if provided
       if (this.filenameGenerator && typeof this.filenameGenerator === 'function') {
-        actualFileName = this.filenameGenerator(clientFileName, chunkIndex, req);
+        actualFileName = this.filenameGenerator(clientFileName, chunkIndexHeader, req);
       } else {
         actualFileName = path.basename(clientFileName);
       }
@@ -419,11 +731,7 @@ class IndexedCPServer {
       
       if (hasPathSeparators || hasTraversal || hasAbsolutePath) {
         this.logger.error(`Security: Rejected filename with path components: ${clientFileName}`);
-        res.writeHead(400, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ 
-          error: 'Invalid filename',
-          message: 'Filename must not contain path separators or traversal sequences'
-        }));
+        sendJson(res, 400, RESPONSES.pathInFilename);
         return;
       }
       
@@ -432,34 +740,25 @@ class IndexedCPServer {
       
       // Validate that we have a valid filename after sanitization
       if (!safeName || safeName === '.' || safeName === '..' || safeName.length === 0) {
-        res.writeHead(400, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ error: 'Invalid filename' }));
+        sendJson(res, 400, RESPONSES.invalidFilename);
         return;
       }
       
       actualFileName = safeName;
       
-      // Check if we have a session for this file
-      const isFirstChunk = !chunkIndex || chunkIndex === '0' || parseInt(chunkIndex) === 0;
+      // First chunk - check for overwrites
+      outputFile = path.join(this.outputDir, actualFileName);
       
-      if (this.uploadSessions.has(clientFileName)) {
-        // Use the same filename from the first chunk
-        actualFileName = this.uploadSessions.get(clientFileName);
-      } else {
-        // First chunk - check for overwrites and create session
-        outputFile = path.join(this.outputDir, actualFileName);
-        
-        if (fs.existsSync(outputFile)) {
-          const ext = path.extname(actualFileName);
-          const base = path.basename(actualFileName, ext);
-          const timestamp = Date.now();
-          actualFileName = `${base}_${timestamp}${ext}`;
-        }
-        
-        // Store the filename for subsequent chunks
-        this.uploadSessions.set(clientFileName, actualFileName);
+      if (fs.existsSync(outputFile)) {
+        const ext = path.extname(actualFileName);
+        const base = path.basename(actualFileName, ext);
+        const timestamp = Date.now();
+        actualFileName = `${base}_${timestamp}${ext}`;
       }
       
+      // Store the filename for subsequent chunks
+      this.uploadSessions.set(key, actualFileName);
+      
       outputFile = path.join(this.outputDir, actualFileName);
       
       // Security: Verify the resolved path is inside outputDir
@@ -468,51 +767,292 @@ class IndexedCPServer {
       if (!resolvedOutputFile.startsWith(resolvedOutputDir + path.sep) && 
           resolvedOutputFile !== resolvedOutputDir) {
         this.logger.error(`Security: Path traversal attempt blocked: ${clientFileName}`);
-        res.writeHead(403, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ error: 'Access denied: invalid path' }));
+        sendJson(res, 403, RESPONSES.accessDenied);
         return;
       }
     }
     
-    // Ensure output directory exists
-    if (!fs.existsSync(this.outputDir)) {
-      fs.mkdirSync(this.outputDir, { recursive: true });
+    // A tracked upload's chunks must fall within its declared chunk count
+    if (trackChunks && chunkIndex + chunkCount > totalChunks) {
+      req.resume();
+      sendJson(res, 400, { error: 'Chunk index out of range', chunkIndex, chunkCount, totalChunks });
+      return;
     }
     
-    const writeStream = fs.createWriteStream(outputFile, { flags: 'a' });
+    // Clients that send the file and chunk size say where each chunk belongs
+    const fileSize = parseInt(req.headers['x-file-size'], 10);
+    const chunkSize = parseInt(req.headers['x-chunk-size'], 10);
+    const sized = trackChunks && fileSize >= 0 && chunkSize > 0;
+    const chunkStart = sized ? chunkIndex * chunkSize : null;
+    if (sized && chunkStart > fileSize) {
+      req.resume();
+      sendJson(res, 400, { error: 'Chunk offset outside file', offset: chunkStart, fileSize });
+      return;
+    }
     
-    req.pipe(writeStream);
+    // X-Total-Chunks sizes the received-chunk bitmap, so it is bounded, and
+    // must agree with the file and chunk size when those are sent
+    if (trackChunks && (totalChunks > this.maxChunksPerUpload ||
+        (sized && totalChunks !== Math.ceil(fileSize / chunkSize)))) {
+      req.resume();
+      sendJson(res, 400, { error: 'Invalid X-Total-Chunks', totalChunks, maxChunksPerUpload: this.maxChunksPerUpload });
+      return;
+    }
     
-    req.on('end', () => {
-      this.logger.info(`Chunk ${chunkIndex} received for ${clientFileName} -> ${actualFileName}`);
-      
-      // Return response with actual filename used
-      res.writeHead(200, { 'Content-Type': 'application/json' });
-      res.end(JSON.stringify({
-        message: 'Chunk received',
-        actualFilename: actualFileName,
-        chunkIndex: parseInt(chunkIndex),
-        clientFilename: clientFileName
-      }));
+    // Several chunks in one request are only accepted with a chunk size (so
+    // the body length can be checked against them), and no more than fit in
+    // the advertised maxRequestSize
+    if (chunkCount > 1 && (!sized || chunkCount > Math.max(1, Math.floor(this.maxRequestSize / chunkSize)))) {
+      req.resume();
+      sendJson(res, 400, { error: 'Invalid X-Chunk-Count', chunkCount, chunkSize: chunkSize || null });
+      return;
+    }
+    
+    // Skip chunks that were already written (e.g. a retry after a lost response).
+    // Clients only coalesce chunks the server lacks, so if the first chunk of a
+    // multi-chunk request is here, the whole request is a retry. The client's
+    // view of the upload is evidently stale, so the reply carries the received
+    // ranges (as on /upload/status) and it can skip the rest without asking.
+    if (trackChunks && this.isChunkReceived(key, chunkIndex)) {
+      const respond = () => {
+        this.logger.debug(`Chunk ${chunkIndex} already received for ${clientFileName} (skipped)`);
+        const upload = this.chunkUploads.get(key);
+        sendJson(res, 200, {
+          message: 'Chunk already received',
+          alreadyReceived: true,
+          actualFilename: actualFileName,
+          chunkIndex,
+          clientFilename: clientFileName,
+          ranges: upload ? upload.received.toRanges() : [],
+          positional: upload ? upload.positional : false
+        });
+      };
+      req.resume();
+      // A client waiting on 100 Continue never sends the body
+      if (req.headers['expect']) {
+        respond();
+      } else {
+        req.on('end', respond);
+      }
+      return;
+    }
+    
+    // Chunks may be compressed in transit (see Accept-Encoding on /upload/status)
+    const contentEncoding = req.headers['content-encoding'] || 'identity';
+    if (contentEncoding !== 'identity' && !Object.hasOwn(CHUNK_DECODERS, contentEncoding)) {
+      req.resume();
+      sendJson(res, 415, { error: 'Unsupported Content-Encoding', encoding: contentEncoding }, ['Accept-Encoding', ACCEPT_ENCODING]);
+      return;
+    }
+    const decompress = contentEncoding === 'identity' ? null : CHUNK_DECODERS[contentEncoding]();
+    
+    this.ensureOutputDir();
+    
+    // Start tracking before any await, so chunks of the same file sent
+    // concurrently all resolve to the filename (and write mode) picked here
+    const upload = trackChunks ? this.getChunkUpload(key, totalChunks, actualFileName) : null;
+    if (upload && !upload.positionalDecision) {
+      upload.positionalDecision = this.isPositionalUpload(sized, outputFile).then((positional) => {
+        upload.positional = positional;
+        return positional;
+      });
+    }
+    const positionalDecision = upload ? upload.positionalDecision : Promise.resolve(false);
+    
+    positionalDecision.then((positional) => {
+      const offset = sized && positional ? chunkStart : null;
+      return this.openFiles.acquire(outputFile, offset === null ? undefined : fileSize)
+        .then((handle) => ({ handle, offset }));
+    }).then(({ handle, offset }) => {
+      this.writeChunkBody(req, res, handle, decompress, {
+        outputFile, actualFileName, clientFileName, key, chunkIndex, chunkCount, totalChunks, trackChunks, offset,
+        // A sized body must fill its chunks exactly (the last may be short)
+        expectedLength: sized ? Math.min(chunkCount * chunkSize, fileSize - chunkStart) : null,
+        maxLength: sized ? null : this.maxRequestSize
+      });
+    }, (error) => {
+      req.resume();
+      this.handleUploadStreamError(error, decompress, res);
     });
+  }
 
-    req.on('error', (error) => {
-      this.logger.error('Upload error:', error);
-      if (!res.headersSent) {
-        res.writeHead(500, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ error: 'Upload error', message: error.message }));
+  /**
+   * Decide, once per upload on its first chunk, whether its chunks are
+   * written at their offsets. Sized uploads get the file sized once and each
+   * chunk written at its own offset, so chunks may land in any order;
+   * otherwise chunks are appended. In allow-paths mode the client names the
+   * file, which may already exist: unless `overwrite` is set, an upload that
+   * starts on an existing file appends to it, as uploads always did before
+   * positional writes.
+   * @returns {Promise<boolean>}
+   */
+  async isPositionalUpload(sized, outputFile) {
+    if (!sized) {
+      return false;
+    }
+    if (this.overwrite || this.pathMode !== 'allow-paths') {
+      return true;
+    }
+    try {
+      await fs.promises.access(outputFile);
+      return false;
+    } catch {
+      return true;
+    }
+  }
+
+  /**
+   * Stream a chunk body into the (already open) output file and respond
+   * once it is on disk
+   */
+  writeChunkBody(req, res, handle, decompress, target) {
+    const { outputFile, actualFileName, clientFileName, key, chunkIndex, chunkCount, totalChunks, trackChunks, offset, expectedLength, maxLength } = target;
+    
+    // Bytes past the chunk's end are refused before they reach the file, so
+    // an oversized (or over-expanding compressed) body can't write into the
+    // chunks after it or past the end of the file
+    const limiter = createLengthLimit(expectedLength !== null ? expectedLength : maxLength);
+    
+    const writeStream = createHandleWriteStream(handle, WRITE_HIGH_WATER_MARK, offset);
+    if (req.headers['expect']) {
+      res.writeContinue();
+    }
+    
+    let hash = null;
+    if (trackChunks) {
+      const upload = this.getChunkUpload(key, totalChunks, actualFileName);
+      if (req.headers['x-file-sha256']) {
+        upload.expectedSha256 = req.headers['x-file-sha256'];
+      }
+      hash = this.getChunkHash(upload, chunkIndex);
+      if (hash) {
+        limiter.on('data', (data) => hash.update(data));
       }
+    }
+    
+    // Return response with actual filename used. `positional` tells the
+    // client its chunks are written at their offsets, so it may coalesce
+    // them and send them out of order.
+    const respond = () => sendJson(res, 200, {
+      message: 'Chunk received',
+      actualFilename: actualFileName,
+      chunkIndex,
+      chunkCount,
+      clientFilename: clientFileName,
+      positional: offset !== null
     });
+    
+    // Stream the body straight to the file. pipeline() destroys every stage
+    // if any of them fails (including a client that aborts mid-chunk), and
+    // the callback runs exactly once: after the data is on disk, or on the
+    // first error.
+    const stages = decompress ? [req, decompress, limiter, writeStream] : [req, limiter, writeStream];
+    pipeline(...stages, (error) => {
+      this.openFiles.release(outputFile, handle);
+      
+      // The chunks are not marked received, so they are sent again
+      if (error && error.code === 'ERR_CHUNK_TOO_LONG') {
+        this.logger.warn(`Chunk ${chunkIndex} of ${clientFileName}: ${error.message}`);
+        sendJson(res, expectedLength !== null ? 400 : 413, expectedLength !== null
+          ? { error: 'Chunk length mismatch', chunkIndex, expectedLength }
+          : { error: 'Chunk too large', chunkIndex, maxLength });
+        return;
+      }
+      if (error) {
+        this.handleUploadStreamError(error, decompress, res);
+        return;
+      }
+      if (expectedLength !== null && limiter.length !== expectedLength) {
+        this.logger.warn(`Chunk ${chunkIndex} of ${clientFileName} had ${limiter.length} bytes, expected ${expectedLength}`);
+        sendJson(res, 400, { error: 'Chunk length mismatch', chunkIndex, length: limiter.length, expectedLength });
+        return;
+      }
+      
+      const chunkLabel = chunkCount > 1 ? `Chunks ${chunkIndex}-${chunkIndex + chunkCount - 1}` : `Chunk ${chunkIndex}`;
+      this.logger.debug(`${chunkLabel} received for ${clientFileName} -> ${actualFileName}`);
+      
+      if (trackChunks) {
+        const upload = this.chunkUploads.get(key);
+        if (hash && upload) {
+          this.commitChunkHash(upload, chunkIndex, chunkCount, hash);
+        }
+        
+        const completed = this.markChunkReceived(key, chunkIndex, totalChunks, actualFileName, chunkCount);
+        if (completed) {
+          this.openFiles.close(outputFile);
+          this.completeUpload(res, completed, outputFile, clientFileName, respond);
+          return;
+        }
+      }
+      
+      respond();
+    });
+  }
 
-    writeStream.on('error', (error) => {
-      this.logger.error('Write error:', error);
+  /**
+   * Verify a completed upload, then call `respond` or answer 409. A file
+   * that fails verification is removed (the client still has its chunks and
+   * sends them again), unless it was appended to in allow-paths mode, where
+   * it may hold data from before the upload.
+   */
+  completeUpload(res, upload, outputFile, clientFileName, respond) {
+    this.verifyUpload(upload, outputFile).then(async (verified) => {
+      if (verified) {
+        this.logger.info(`Upload complete: ${clientFileName} -> ${upload.actualFileName} (${upload.totalChunks} chunks)`);
+        respond();
+        return;
+      }
+      
+      const owned = upload.positional || this.pathMode !== 'allow-paths';
+      if (owned) {
+        await fs.promises.rm(outputFile, { force: true });
+      }
+      this.logger.error(`Checksum mismatch for ${clientFileName} -> ${upload.actualFileName}; ` +
+        (owned ? 'file removed' : 'file left in place'));
+      sendJson(res, 409, {
+        error: 'Checksum mismatch',
+        message: 'Uploaded data does not match X-File-SHA256',
+        clientFilename: clientFileName
+      });
+    }).catch((error) => {
+      this.logger.error('Verification error:', error);
       if (!res.headersSent) {
-        res.writeHead(500, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ error: 'Write error', message: error.message }));
+        sendJson(res, 500, { error: 'Verification error', message: error.message });
       }
     });
   }
 
+  /**
+   * Report a failed chunk body. The chunk is not marked as received, so the
+   * client's retry (or a resume) sends it again.
+   * @param {Error} error - Error from the upload pipeline
+   * @param {stream.Transform|null} decompress - Decompression stage, if any
+   * @param {http.ServerResponse} res
+   */
+  handleUploadStreamError(error, decompress, res) {
+    if (error.code === 'ENOENT') {
+      this.outputDirReady = false;
+      this.createdDirs.clear();
+    }
+    
+    const invalidBody = decompress !== null && typeof error.code === 'string' && /^(Z|ZSTD)_/.test(error.code);
+    if (error.code === 'ERR_STREAM_PREMATURE_CLOSE' || error.code === 'ECONNRESET') {
+      this.logger.warn('Upload aborted by client:', error.message);
+    } else if (invalidBody) {
+      this.logger.error('Decompression error:', error);
+    } else {
+      this.logger.error('Upload error:', error);
+    }
+    
+    if (!res.headersSent && !res.destroyed) {
+      const status = invalidBody ? 400 : 500;
+      sendJson(res, status, {
+        error: invalidBody ? 'Invalid compressed body' : 'Upload error',
+        message: error.message
+      });
+    }
+  }
+
   // ============================================================================
   // Encrypted Upload Handlers (only used when encryption: true)
   // ============================================================================
@@ -523,11 +1063,9 @@ class IndexedCPServer {
   handlePublicKeyRequest(req, res) {
     try {
       const publicKeyInfo = this.getActivePublicKey();
-      res.writeHead(200, { 'Content-Type': 'application/json' });
-      res.end(JSON.stringify(publicKeyInfo));
+      sendJson(res, 200, publicKeyInfo);
     } catch (error) {
-      res.writeHead(500, { 'Content-Type': 'application/json' });
-      res.end(JSON.stringify({ error: error.message }));
+      sendJson(res, 500, { error: error.message });
     }
   }
 
@@ -537,14 +1075,12 @@ class IndexedCPServer {
   async handleKeyRotation(req, res) {
     try {
       const newKid = await this.rotateKeys();
-      res.writeHead(200, { 'Content-Type': 'application/json' });
-      res.end(JSON.stringify({ 
+      sendJson(res, 200, { 
         message: 'Keys rotated successfully',
         newKeyId: newKid 
-      }));
+      });
     } catch (error) {
-      res.writeHead(500, { 'Content-Type': 'application/json' });
-      res.end(JSON.stringify({ error: error.message }));
+      sendJson(res, 500, { error: error.message });
     }
   }
 
@@ -552,21 +1088,22 @@ class IndexedCPServer {
    * Handle encrypted packet upload
    */
   async handleEncryptedUpload(req, res) {
-    let body = '';
+    // Collect raw Buffers and decode once; appending chunk.toString() to a
+    // string re-copies the body on every read and can split UTF-8 sequences
+    const bodyChunks = [];
     
     req.on('data', chunk => {
-      body += chunk.toString();
+      bodyChunks.push(chunk);
     });
     
     req.on('end', async () => {
       try {
-        const packet = JSON.parse(body);
+        const packet = JSON.parse(Buffer.concat(bodyChunks).toString('utf8'));
         
         // Validate packet structure
         if (!packet.sessionId || !packet.kid || !packet.wrappedKey || 
             !packet.ciphertext || !packet.iv || !packet.authTag || !packet.aad) {
-          res.writeHead(400, { 'Content-Type': 'application/json' });
-          res.end(JSON.stringify({ error: 'Invalid packet structure' }));
+          sendJson(res, 400, RESPONSES.invalidPacket);
           return;
         }
         
@@ -602,30 +1139,8 @@ class IndexedCPServer {
         
         // Generate filename for this packet
         const fileName = packet.fileName || `session-${packet.sessionId}.txt`;
-        const chunkIndex = packet.seq || 0;
         
-        // Use existing handleUpload logic by setting appropriate headers
-        const fakeReq = {
-          headers: {
-            'x-chunk-index': chunkIndex.toString(),
-            'x-file-name': `session:${packet.sessionId}`
-          },
-          pipe: (writeStream) => {
-            writeStream.write(plaintext);
-            writeStream.end();
-          },
-          on: (event, handler) => {
-            if (event === 'end') {
-              // Call immediately since we already have all data
-              setImmediate(handler);
-            }
-          }
-        };
-        
-        // Ensure output directory exists
-        if (!fs.existsSync(this.outputDir)) {
-          fs.mkdirSync(this.outputDir, { recursive: true });
-        }
+        this.ensureOutputDir();
         
         // Generate output filename
         let actualFileName;
@@ -643,38 +1158,36 @@ class IndexedCPServer {
         }
         
         const outputFile = path.join(this.outputDir, actualFileName);
-        const writeStream = fs.createWriteStream(outputFile, { flags: 'a' });
-        
-        writeStream.write(plaintext);
-        writeStream.end();
         
-        writeStream.on('finish', () => {
-          this.logger.info(`✓ Decrypted and saved packet ${packet.seq} for session ${packet.sessionId}`);
-          res.writeHead(200, { 'Content-Type': 'application/json' });
-          res.end(JSON.stringify({
-            message: 'Packet decrypted and saved',
-            actualFilename: actualFileName
-          }));
-        });
-        
-        writeStream.on('error', (error) => {
-          this.logger.error('Write error:', error);
-          res.writeHead(500, { 'Content-Type': 'application/json' });
-          res.end(JSON.stringify({ error: 'Write error', message: error.message }));
-        });
+        // The plaintext is already a single Buffer: append it through the
+        // session's cached handle instead of opening the file per packet
+        this.openFiles.acquire(outputFile)
+          .then((handle) => handle.appendFile(plaintext)
+            .finally(() => this.openFiles.release(outputFile, handle)))
+          .then(() => {
+            this.logger.debug(`✓ Decrypted and saved packet ${packet.seq} for session ${packet.sessionId}`);
+            sendJson(res, 200, {
+              message: 'Packet decrypted and saved',
+              actualFilename: actualFileName
+            });
+          }, (error) => {
+            if (error.code === 'ENOENT') {
+              this.outputDirReady = false;
+            }
+            this.logger.error('Write error:', error);
+            sendJson(res, 500, { error: 'Write error', message: error.message });
+          });
         
       } catch (error) {
         this.logger.error('Decryption error:', error);
-        res.writeHead(500, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ error: 'Decryption failed', message: error.message }));
+        sendJson(res, 500, { error: 'Decryption failed', message: error.message });
       }
     });
     
     req.on('error', (error) => {
       this.logger.error('Request error:', error);
       if (!res.headersSent) {
-        res.writeHead(500, { 'Content-Type': 'application/json' });
-        res.end(JSON.stringify({ error: 'Request error', message: error.message }));
+        sendJson(res, 500, { error: 'Request error', message: error.message });
       }
     });
   }
@@ -700,38 +1213,60 @@ class IndexedCPServer {
       await this.cleanupExpiredKeys();
     }
     
+    // Create the output directory up front, off the request path
+    await fs.promises.mkdir(this.outputDir, { recursive: true });
+    this.outputDirReady = true;
+    
     if (!this.server) {
       this.createServer();
     }
     
-    this.server.listen(serverPort, () => {
-      this.logger.info(`Server listening on http://localhost:${serverPort}`);
-      this.logger.info(`API Key: ${this.apiKey}`);
-      
-      if (this.encryption) {
-        this.logger.info(`Active Key ID: ${this.activeKeyId}`);
-        this.logger.info('Endpoints:');
-        this.logger.info('  GET  /public-key        - Fetch server public key');
-        this.logger.info('  POST /upload-encrypted  - Upload encrypted packets');
-        this.logger.info('  POST /upload            - Legacy unencrypted upload');
-        this.logger.info('  POST /rotate-keys       - Rotate encryption keys');
-      } else {
-        this.logger.info('Endpoints:');
-        this.logger.info('  POST /upload            - Upload files');
-      }
-      
-      if (callback) callback();
+    // Resolves once the socket is accepting connections, so callers can
+    // await listen() instead of waiting a fixed time
+    await new Promise((resolve, reject) => {
+      this.server.once('error', reject);
+      this.server.listen(serverPort, () => {
+        this.server.off('error', reject);
+        resolve();
+      });
     });
+    
+    this.logger.info(`Server listening on http://localhost:${serverPort}`);
+    this.logger.info(`API Key: ${this.apiKey}`);
+    
+    if (this.encryption) {
+      this.logger.info(`Active Key ID: ${this.activeKeyId}`);
+      this.logger.info('Endpoints:');
+      this.logger.info('  GET  /public-key        - Fetch server public key');
+      this.logger.info('  POST /upload-encrypted  - Upload encrypted packets');
+      this.logger.info('  POST /upload            - Legacy unencrypted upload');
+      this.logger.info('  POST /rotate-keys       - Rotate encryption keys');
+    } else {
+      this.logger.info('Endpoints:');
+      this.logger.info('  POST /upload            - Upload files');
+    }
+    
+    if (callback) callback();
   }
 
+  /**
+   * Stop accepting connections and release open files and the keystore
+   * @returns {Promise<void>} Resolves once the port is free and files are closed
+   */
   close() {
+    clearInterval(this.uploadSweepTimer);
+    this.uploadSweepTimer = null;
+    
+    const closing = [];
     if (this.server) {
-      this.server.close();
+      closing.push(new Promise((resolve) => this.server.close(() => resolve())));
     }
     
+    closing.push(this.openFiles.closeAll());
+    
     // Close keystore connection if encryption enabled
     if (this.encryption && this.keyStore) {
-      this.keyStore.close();
+      closing.push(this.keyStore.close());
     }
     
     // Clear sensitive data
@@ -739,7 +1274,111 @@ class IndexedCPServer {
       this.keyPairs.clear();
       this.sessionCache.clear();
     }
+    
+    return Promise.all(closing).then(() => {});
+  }
+}
+
+// Fixed response bodies, serialized once rather than per request
+const RESPONSES = {
+  missingFilename: jsonBody({ error: 'Missing filename parameter' }),
+  unauthorized: jsonBody({ error: 'Invalid or missing API key' }),
+  invalidFilename: jsonBody({ error: 'Invalid filename' }),
+  traversalFilename: jsonBody({
+    error: 'Invalid filename',
+    message: 'Filename must not contain traversal sequences or absolute paths'
+  }),
+  pathInFilename: jsonBody({
+    error: 'Invalid filename',
+    message: 'Filename must not contain path separators or traversal sequences'
+  }),
+  accessDenied: jsonBody({ error: 'Access denied: invalid path' }),
+  invalidPacket: jsonBody({ error: 'Invalid packet structure' })
+};
+
+function jsonBody(body) {
+  return Buffer.from(JSON.stringify(body));
+}
+
+/**
+ * Send a JSON response. With CORS and Content-Length set up front, Node
+ * writes the status line, headers and body to the socket in one go.
+ * @param {http.ServerResponse} res
+ * @param {number} statusCode
+ * @param {Object|Buffer} body - Response object, or a body serialized in advance
+ * @param {string[]} [headers] - Extra headers as a flat [name, value, ...] list
+ */
+function sendJson(res, statusCode, body, headers = []) {
+  const json = Buffer.isBuffer(body) ? body : JSON.stringify(body);
+  res.writeHead(statusCode, [
+    ...CORS_HEADERS,
+    'Content-Type', 'application/json',
+    'Content-Length', String(Buffer.byteLength(json)),
+    ...headers
+  ]);
+  res.end(json);
+}
+
+/**
+ * Key an upload's tracking entries by the client's file name plus, when the
+ * client sends them, the file's size and SHA-256, so that different files
+ * uploaded under the same name never share received chunks or an output file
+ * @param {string} clientFileName - X-File-Name
+ * @param {string|null} [fileSize] - X-File-Size (sized uploads only)
+ * @param {string|null} [fileSha256] - X-File-SHA256
+ * @returns {string}
+ */
+function uploadKey(clientFileName, fileSize, fileSha256) {
+  return `${clientFileName}\n${fileSize || ''}\n${fileSha256 ? fileSha256.toLowerCase() : ''}`;
+}
+
+/**
+ * Pass a chunk body through unchanged, failing with ERR_CHUNK_TOO_LONG as
+ * soon as more than `limit` bytes have gone by. The piece that crosses the
+ * limit is not passed on. `length` holds the bytes passed so far.
+ * @param {number} limit
+ * @returns {stream.Transform}
+ */
+function createLengthLimit(limit) {
+  const limiter = new Transform({
+    transform(data, encoding, callback) {
+      if (limiter.length + data.length > limit) {
+        const error = new Error(`Chunk body exceeds ${limit} bytes`);
+        error.code = 'ERR_CHUNK_TOO_LONG';
+        callback(error);
+        return;
+      }
+      limiter.length += data.length;
+      callback(null, data);
+    }
+  });
+  limiter.length = 0;
+  return limiter;
+}
+
+/**
+ * Read one query parameter from a request URL without building a URL and
+ * URLSearchParams for it. Decodes like a form ('+' is a space).
+ * @param {string} url - Request URL (path and query)
+ * @param {string} name - Parameter name
+ * @returns {string|null} First value, or null if absent or badly escaped
+ */
+function getQueryParam(url, name) {
+  const queryStart = url.indexOf('?');
+  if (queryStart === -1) {
+    return null;
+  }
+  const prefix = `${name}=`;
+  for (const pair of url.slice(queryStart + 1).split('&')) {
+    if (pair.startsWith(prefix)) {
+      try {
+        return decodeURIComponent(pair.slice(prefix.length).replace(/\+/g, ' '));
+      } catch {
+        return null;
+      }
+    }
   }
+  return null;
 }
 
 // Helper function to create a simple server like in the example
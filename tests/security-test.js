@@ -42,7 +42,7 @@ function cleanup() {
 }
 
 // Make a test upload request
-async function testUpload(filename, shouldSucceed = true) {
+async function testUpload(filename, shouldSucceed = true, authorization = `Bearer ${API_KEY}`) {
   return new Promise((resolve) => {
     const data = 'malicious content';
     const options = {
@@ -51,7 +51,7 @@ async function testUpload(filename, shouldSucceed = true) {
       path: '/upload',
       method: 'POST',
       headers: {
-        'Authorization': `Bearer ${API_KEY}`,
+        'Authorization': authorization,
         'X-File-Name': filename,
         'X-Chunk-Index': '0',
         'Content-Length': data.length
@@ -149,6 +149,30 @@ async function runSecurityTests() {
     }
   }
 
+  // Requests with a wrong or malformed API key never reach the upload handler
+  log('\nChecking API key validation...', 'cyan');
+  const authTests = [
+    { name: 'Wrong key, same length', authorization: `Bearer ${API_KEY.slice(0, -1)}x` },
+    { name: 'Wrong key, different length', authorization: `Bearer ${API_KEY}-extra` },
+    { name: 'Missing Bearer prefix', authorization: API_KEY },
+    { name: 'Empty key', authorization: 'Bearer ' }
+  ];
+
+  for (const test of authTests) {
+    process.stdout.write(`Testing: ${test.name.padEnd(40)} `);
+    
+    const result = await testUpload('auth.txt', false, test.authorization);
+    
+    if (result.statusCode === 401) {
+      log('✓ PASS', 'green');
+      passed++;
+    } else {
+      log('✗ FAIL', 'red');
+      log(`  Expected: 401, Got: ${result.statusCode}`, 'red');
+      failed++;
+    }
+  }
+
   // Check that no files were written outside TEST_DIR
   log('\nChecking filesystem security...', 'cyan');
   const filesInTestDir = fs.readdirSync(TEST_DIR);
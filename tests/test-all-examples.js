@@ -338,9 +338,6 @@ async function runAllTests() {
       });
     });
     
-    // Give server a moment to fully initialize
-    await new Promise(resolve => setTimeout(resolve, 500));
-    
     // Run all tests
     const tests = [
       { name: 'Basic Client Upload', fn: testBasicClientUpload },
@@ -367,13 +364,9 @@ async function runAllTests() {
         }
       }
       
-      // Clean uploads between tests
-      if (fs.existsSync(UPLOAD_DIR)) {
-        const files = fs.readdirSync(UPLOAD_DIR);
-        files.forEach(file => {
-          fs.unlinkSync(path.join(UPLOAD_DIR, file));
-        });
-      }
+      // Clean uploads between tests (the server expects the directory to exist)
+      fs.rmSync(UPLOAD_DIR, { recursive: true, force: true });
+      fs.mkdirSync(UPLOAD_DIR, { recursive: true });
     }
     
   } catch (error) {
@@ -20,25 +20,38 @@ function log(msg, color = 'reset') {
 
 function runTest(script, name, skipTestMode = false) {
   return new Promise((resolve) => {
-    log(`\n${'═'.repeat(70)}`, 'cyan');
-    log(`Running: ${name}`, 'bold');
-    log('═'.repeat(70) + '\n', 'cyan');
-
     const env = skipTestMode ? { ...process.env } : { ...process.env, INDEXEDCP_TEST_MODE: 'true' };
 
     const proc = spawn('node', [path.join(__dirname, script)], {
       cwd: path.dirname(__dirname),
-      stdio: 'inherit',
+      stdio: ['ignore', 'pipe', 'pipe'],
       env
     });
 
+    // Suites may run side by side, so each one's output is held back and
+    // printed in one piece when it finishes
+    const output = [];
+    proc.stdout.on('data', (data) => output.push(data));
+    proc.stderr.on('data', (data) => output.push(data));
+
+    let finished = false;
+    const finish = (result) => {
+      if (finished) return;
+      finished = true;
+      log(`\n${'═'.repeat(70)}`, 'cyan');
+      log(`Ran: ${name}`, 'bold');
+      log('═'.repeat(70) + '\n', 'cyan');
+      process.stdout.write(Buffer.concat(output));
+      resolve(result);
+    };
+
     proc.on('close', (code) => {
-      resolve({ name, script, exitCode: code, passed: code === 0 });
+      finish({ name, script, exitCode: code, passed: code === 0 });
     });
 
     proc.on('error', (err) => {
-      log(`Error running ${name}: ${err.message}`, 'red');
-      resolve({ name, script, exitCode: 1, passed: false, error: err.message });
+      output.push(Buffer.from(`Error running ${name}: ${err.message}\n`));
+      finish({ name, script, exitCode: 1, passed: false, error: err.message });
     });
   });
 }
@@ -48,21 +61,27 @@ async function runAllTests() {
   log('IndexedCP - Complete Test Suite', 'yellow');
   log('═'.repeat(70) + '\n', 'yellow');
 
+  // Suites that share state under ~/.indexcp run one after another. Isolated
+  // ones (own port and directories, in-memory database) run alongside them.
   const tests = [
     { script: './test-indexeddbshim.js', name: 'IndexedDBShim Integration Test', skipTestMode: true },
-    { script: './test-all-examples.js', name: 'Functional Tests' },
-    { script: './security-test.js', name: 'Security Tests' },
+    { script: './test-all-examples.js', name: 'Functional Tests', isolated: true },
+    { script: './security-test.js', name: 'Security Tests', isolated: true },
     { script: './test-restart-persistence.js', name: 'Restart Persistence Tests' },
     { script: './test-encryption.js', name: 'Encryption Tests' },
-    { script: './test-cli-ls.js', name: 'CLI ls Command Tests' }
+    { script: './test-cli-ls.js', name: 'CLI ls Command Tests' },
+    { script: './test-resume.js', name: 'Resumable Upload Tests', isolated: true }
   ];
 
-  const results = [];
-
-  for (const test of tests) {
-    const result = await runTest(test.script, test.name, test.skipTestMode);
-    results.push(result);
-  }
+  let serial = Promise.resolve();
+  const results = await Promise.all(tests.map((test) => {
+    const run = () => runTest(test.script, test.name, test.skipTestMode);
+    if (test.isolated) {
+      return run();
+    }
+    serial = serial.then(run);
+    return serial;
+  }));
 
   // Print summary
   log('\n' + '═'.repeat(70), 'yellow');
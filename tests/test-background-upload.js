@@ -113,9 +113,8 @@ async function runTest() {
     console.log('============================================================');
     
     // Clean upload dir
-    uploadedFiles.forEach(file => {
-      fs.unlinkSync(path.join(OUTPUT_DIR, file));
-    });
+    fs.rmSync(OUTPUT_DIR, { recursive: true, force: true });
+    fs.mkdirSync(OUTPUT_DIR, { recursive: true });
     
     const testFile3 = path.join(TEST_DIR, 'test-file-3.txt');
     fs.writeFileSync(testFile3, 'Test content for retry test\n'.repeat(50));
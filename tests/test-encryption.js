@@ -91,7 +91,9 @@ class EncryptionTestSuite {
       port: this.port,
       apiKey: this.apiKey,
       pathMode: 'ignore',
-      encryption: true            // Enable encryption
+      encryption: true,           // Enable encryption
+      // Keep generated key pairs out of the working tree
+      keystoreOptions: { keyStorePath: path.join(this.testDir, 'server-keys') }
     });
 
     return new Promise((resolve) => {
@@ -161,6 +161,8 @@ async function testIndexedDBShim() {
       outputDir: UPLOAD_DIR,
       apiKey: TEST_API_KEY,
       encryption: true,
+      // Keep generated key pairs out of the working tree
+      keystoreOptions: { keyStorePath: path.join(TEST_DIR, 'server-keys') },
       logLevel: 'error'
     });
     
@@ -25,7 +25,7 @@ const TEST_PORT = 3400;
 const API_KEY = 'test-api-key-path-modes';
 
 // Helper to upload a file chunk
-async function uploadFile(port, filename, content, apiKey) {
+async function uploadFile(port, filename, content, apiKey, extraHeaders = {}) {
   return new Promise((resolve, reject) => {
     const data = Buffer.from(content);
     const options = {
@@ -38,7 +38,8 @@ async function uploadFile(port, filename, content, apiKey) {
         'Content-Length': data.length,
         'X-File-Name': filename,
         'X-Chunk-Index': 0,
-        'Authorization': `Bearer ${apiKey}`
+        'Authorization': `Bearer ${apiKey}`,
+        ...extraHeaders
       }
     };
 
@@ -106,6 +107,39 @@ const tests = [
     shouldSucceed: true,
     checkFile: 'a/b/c/test.txt'
   },
+  {
+    name: 'Mode: allow-paths - Existing file appended to, not replaced',
+    mode: 'allow-paths',
+    filename: 'existing.txt',
+    existingContent: 'old content\n',
+    content: 'new content',
+    sized: true, // Sends the headers that enable positional writes
+    shouldSucceed: true,
+    checkFile: 'existing.txt',
+    expectedContent: 'old content\nnew content'
+  },
+  {
+    name: 'Mode: allow-paths + overwrite - Existing file replaced',
+    mode: 'allow-paths',
+    serverOptions: { overwrite: true },
+    filename: 'replaced.txt',
+    existingContent: 'old content that is longer\n',
+    content: 'new content',
+    sized: true,
+    shouldSucceed: true,
+    checkFile: 'replaced.txt'
+  },
+  {
+    name: 'Mode: allow-paths + overwrite - Positional upload after an append',
+    mode: 'allow-paths',
+    serverOptions: { overwrite: true },
+    filename: 'reopened.txt',
+    priorContent: 'appended by an unsized upload\n', // Leaves an append-mode handle open
+    content: 'new content',
+    sized: true,
+    shouldSucceed: true,
+    checkFile: 'reopened.txt'
+  },
   {
     name: 'Mode: allow-paths - Traversal rejected',
     mode: 'allow-paths',
@@ -141,41 +175,60 @@ const tests = [
 let passed = 0;
 let failed = 0;
 
+// One server (and output directory) per mode and options, shared by
+// consecutive tests with that setup; they upload distinct filenames, so they
+// don't collide
+async function startServer(mode, options = {}) {
+  const dir = path.join(__dirname, `test-path-mode-${mode}-${Date.now()}`);
+  fs.mkdirSync(dir, { recursive: true });
+  const server = new IndexedCPServer({
+    port: TEST_PORT,
+    outputDir: dir,
+    apiKey: API_KEY,
+    pathMode: mode,
+    ...options
+  });
+  // Resolves once the server is accepting connections
+  await server.listen(TEST_PORT);
+  return { mode, options, server, dir };
+}
+
+// close() resolves once the port is free for the next mode's server
+async function stopServer(shared) {
+  if (shared) {
+    await shared.server.close();
+    fs.rmSync(shared.dir, { recursive: true, force: true });
+  }
+}
+
 async function runTests() {
   console.log(`${COLORS.cyan}${COLORS.bright}════════════════════════════════════════════════════════════`);
   console.log(`IndexedCP - Path Mode Tests`);
   console.log(`═══════════════════════════════════════════════════════════=${COLORS.reset}\n`);
 
+  let shared = null;
+  
   for (const test of tests) {
-    const testDir = path.join(__dirname, `test-path-mode-${test.mode}-${Date.now()}`);
-    let server = null;
+    const options = test.serverOptions || {};
+    if (!shared || shared.mode !== test.mode || JSON.stringify(shared.options) !== JSON.stringify(options)) {
+      await stopServer(shared);
+      shared = await startServer(test.mode, options);
+    }
+    const testDir = shared.dir;
     
     try {
-      // Create test directory
-      if (!fs.existsSync(testDir)) {
-        fs.mkdirSync(testDir, { recursive: true });
+      if (test.existingContent !== undefined) {
+        fs.writeFileSync(path.join(testDir, test.filename), test.existingContent);
+      }
+      if (test.priorContent !== undefined) {
+        await uploadFile(TEST_PORT, test.filename, test.priorContent, API_KEY);
       }
-
-      // Start server with specific mode
-      server = new IndexedCPServer({
-        port: TEST_PORT,
-        outputDir: testDir,
-        apiKey: API_KEY,
-        pathMode: test.mode
-      });
       
-      await new Promise((resolve, reject) => {
-        server.listen(TEST_PORT, (err) => {
-          if (err) reject(err);
-          else resolve();
-        });
-      });
-
-      // Wait for server to be ready
-      await new Promise(resolve => setTimeout(resolve, 200));
-
       // Upload file
-      const result = await uploadFile(TEST_PORT, test.filename, test.content, API_KEY);
+      const sizeHeaders = test.sized
+        ? { 'X-Total-Chunks': 1, 'X-File-Size': Buffer.byteLength(test.content), 'X-Chunk-Size': Buffer.byteLength(test.content) }
+        : {};
+      const result = await uploadFile(TEST_PORT, test.filename, test.content, API_KEY, sizeHeaders);
       
       const success = test.shouldSucceed ? (result.statusCode === 200) : (result.statusCode !== 200);
       
@@ -188,7 +241,7 @@ async function runTests() {
               throw new Error(`Expected file not found: ${test.checkFile}`);
             }
             const content = fs.readFileSync(filePath, 'utf8');
-            if (content !== test.content) {
+            if (content !== (test.expectedContent || test.content)) {
               throw new Error(`Content mismatch`);
             }
           }
@@ -225,10 +278,11 @@ async function runTests() {
           }
           
           if (test.secondUpload.checkDifferent) {
-            // Verify two different files exist
-            const files = fs.readdirSync(testDir);
-            if (files.length < 2) {
-              throw new Error(`Expected 2 files (overwrite prevention failed), found ${files.length}`);
+            // Verify two different files exist (the directory is shared with
+            // the mode's other tests, so check these uploads by name)
+            const names = [result.body.actualFilename, result2.body.actualFilename];
+            if (names[0] === names[1] || !names.every((name) => fs.existsSync(path.join(testDir, name)))) {
+              throw new Error(`Expected 2 files (overwrite prevention failed), got ${names.join(', ')}`);
             }
           }
         }
@@ -240,34 +294,14 @@ async function runTests() {
         console.log(`  Expected: ${test.shouldSucceed ? 'success' : 'failure'}, Got: ${result.statusCode}`);
         failed++;
       }
-
-      // Cleanup
-      if (server) {
-        server.close();
-        await new Promise(resolve => setTimeout(resolve, 200));
-      }
-      if (fs.existsSync(testDir)) {
-        fs.rmSync(testDir, { recursive: true, force: true });
-      }
-      
-      // Wait between tests
-      await new Promise(resolve => setTimeout(resolve, 200));
-      
     } catch (error) {
       console.log(`${COLORS.red}✗ FAIL${COLORS.reset} - ${test.name}`);
       console.log(`  Error: ${error.message}`);
       failed++;
-      
-      // Cleanup on error
-      if (server) {
-        server.close();
-        await new Promise(resolve => setTimeout(resolve, 200));
-      }
-      if (fs.existsSync(testDir)) {
-        fs.rmSync(testDir, { recursive: true, force: true });
-      }
     }
   }
+  
+  await stopServer(shared);
 
   // Summary
   console.log(`\n${COLORS.cyan}${COLORS.bright}════════════════════════════════════════════════════════════${COLORS.reset}`);
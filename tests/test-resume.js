@@ -0,0 +1,945 @@
+#!/usr/bin/env node
+// test-resume.js
+// Tests resumable uploads: retry backoff, server-side chunk tracking, deduplication,
+// whole-file checksums, compressed chunks, out-of-order positional writes,
+// variable-size chunks and resyncing a stale client
+
+// Set test mode to use fake-indexeddb
+process.env.INDEXEDCP_TEST_MODE = 'true';
+
+const path = require('path');
+const fs = require('fs');
+const os = require('os');
+const http = require('http');
+const crypto = require('crypto');
+const zlib = require('zlib');
+const { IndexedCPServer } = require('../server');
+const IndexedCPClient = require('../client');
+const { ChunkBitmap } = require('../lib/chunk-bitmap');
+
+// Test configuration
+const TEST_PORT = 3420;
+// Uploads and source files all live in one temporary directory, removed
+// with a single call when the run ends
+const WORK_DIR = fs.mkdtempSync(path.join(os.tmpdir(), 'indexcp-resume-'));
+const UPLOAD_DIR = path.join(WORK_DIR, 'uploads');
+const API_KEY = 'test-api-key-resume';
+const CHUNK_SIZE = 512;
+// The resume scenario runs once per size; 384 leaves a short last chunk
+const RESUME_CHUNK_SIZES = [CHUNK_SIZE, 256, 384];
+const SERVER_URL = `http://localhost:${TEST_PORT}/upload`;
+
+// Color codes for terminal output
+const colors = {
+  reset: '\x1b[0m',
+  green: '\x1b[32m',
+  red: '\x1b[31m',
+  yellow: '\x1b[33m',
+  blue: '\x1b[34m',
+  cyan: '\x1b[36m',
+};
+
+function log(message, color = 'reset') {
+  console.log(`${colors[color]}${message}${colors.reset}`);
+}
+
+function logTest(testName) {
+  console.log(`\n${'='.repeat(60)}`);
+  log(`Testing: ${testName}`, 'cyan');
+  console.log('='.repeat(60));
+}
+
+function logSuccess(message) {
+  log(`✓ ${message}`, 'green');
+}
+
+function logError(message) {
+  log(`✗ ${message}`, 'red');
+}
+
+function logInfo(message) {
+  log(`ℹ ${message}`, 'blue');
+}
+
+// Raw requests share keep-alive connections (Node 18's global agent opens
+// a new one per request)
+const agent = new http.Agent({ keepAlive: true });
+
+function cleanup() {
+  fs.rmSync(WORK_DIR, { recursive: true, force: true });
+}
+
+// Send one raw chunk, as an interrupted client would have. With
+// Expect: 100-continue the body is only sent once the server asks for it.
+function sendChunk(fileName, chunkIndex, totalChunks, data, extraHeaders = {}) {
+  return new Promise((resolve, reject) => {
+    let continued = false;
+    const req = http.request({
+      hostname: 'localhost',
+      port: TEST_PORT,
+      path: '/upload',
+      method: 'POST',
+      agent,
+      headers: {
+        'Content-Type': 'application/octet-stream',
+        'Content-Length': data.length,
+        'X-File-Name': fileName,
+        'X-Chunk-Index': chunkIndex,
+        'X-Total-Chunks': totalChunks,
+        'Authorization': `Bearer ${API_KEY}`,
+        ...extraHeaders
+      }
+    }, (res) => {
+      let body = '';
+      res.on('data', (chunk) => body += chunk);
+      res.on('end', () => {
+        if (!req.writableFinished) {
+          req.destroy();
+        }
+        resolve({ statusCode: res.statusCode, body: JSON.parse(body), continued });
+      });
+    });
+    req.on('error', reject);
+    if (extraHeaders['Expect'] === '100-continue') {
+      req.on('continue', () => {
+        continued = true;
+        req.end(data);
+      });
+      req.flushHeaders();
+    } else {
+      req.end(data);
+    }
+  });
+}
+
+// Deterministic pseudo-random bytes (mulberry32), so chunk boundaries are the
+// same on every run
+function pseudoRandomBytes(length, seed) {
+  const bytes = Buffer.alloc(length);
+  let state = seed >>> 0;
+  for (let i = 0; i < length; i++) {
+    state = (state + 0x6D2B79F5) >>> 0;
+    let t = Math.imul(state ^ (state >>> 15), state | 1);
+    t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+    bytes[i] = (t ^ (t >>> 14)) & 0xFF;
+  }
+  return bytes;
+}
+
+// Payloads are built once per run and written to disk as raw bytes
+const RESUME_PAYLOAD = Buffer.alloc(CHUNK_SIZE * 5);
+for (let i = 0; i < RESUME_PAYLOAD.length; i++) {
+  RESUME_PAYLOAD[i] = i % 251;
+}
+const COMPRESSIBLE_PAYLOAD = Buffer.from('Compressible line of text\n'.repeat(200));
+// Incompressible and non-repeating, so no chunk matches another by accident
+const VARIABLE_PAYLOAD = pseudoRandomBytes(64 * 1024, 42);
+
+/**
+ * Split data into chunks of pseudo-random length, the way a client with
+ * variable-size chunks would send them.
+ * @param {Buffer} data
+ * @returns {Buffer[]} Chunks (views into data)
+ */
+function variableChunks(data, { min = 256, max = 2048 } = {}) {
+  const lengths = pseudoRandomBytes(Math.ceil(data.length / min), 7);
+  const chunks = [];
+  let offset = 0;
+  for (let i = 0; offset < data.length; i++) {
+    const length = min + Math.floor(lengths[i] / 256 * (max - min));
+    chunks.push(data.subarray(offset, offset + length));
+    offset += length;
+  }
+  return chunks;
+}
+
+function sha256(data) {
+  return crypto.createHash('sha256').update(data).digest('hex');
+}
+
+// Check an uploaded file against the expected bytes by streaming it through
+// SHA-256, rather than reading the whole file into memory
+async function verifyUpload(actualFilename, expected) {
+  const hash = crypto.createHash('sha256');
+  for await (const data of fs.createReadStream(path.join(UPLOAD_DIR, actualFilename))) {
+    hash.update(data);
+  }
+  if (hash.digest('hex') !== sha256(expected)) {
+    throw new Error(`Content mismatch in ${actualFilename}`);
+  }
+}
+
+// `file` holds the size and sha256 the upload's chunks were sent with, which
+// the server tracks it under
+function getStatus(fileName, headers = {}, file = {}) {
+  let query = `filename=${encodeURIComponent(fileName)}`;
+  for (const [name, value] of Object.entries(file)) {
+    query += `&${name}=${value}`;
+  }
+  return new Promise((resolve, reject) => {
+    http.get({
+      hostname: 'localhost',
+      port: TEST_PORT,
+      path: `/upload/status?${query}`,
+      agent,
+      headers: { 'Authorization': `Bearer ${API_KEY}`, ...headers }
+    }, (res) => {
+      let body = '';
+      res.on('data', (chunk) => body += chunk);
+      res.on('end', () => resolve({ statusCode: res.statusCode, body: JSON.parse(body) }));
+    }).on('error', reject);
+  });
+}
+
+// Test 1: Retry backoff
+async function testRetryMechanism() {
+  logTest('Retry Mechanism');
+
+  const client = new IndexedCPClient({ apiKey: API_KEY });
+  const { initialRetryDelay, maxRetryDelay } = client;
+
+  if (client.computeRetryDelay(1, new Error('network')) !== 0) {
+    throw new Error('First retry should be immediate');
+  }
+  logSuccess('First retry is immediate');
+
+  for (let attempt = 2; attempt <= 20; attempt++) {
+    const delay = client.computeRetryDelay(attempt, new Error('network'));
+    if (delay < initialRetryDelay || delay > maxRetryDelay) {
+      throw new Error(`Delay ${delay} for attempt ${attempt} outside [${initialRetryDelay}, ${maxRetryDelay}]`);
+    }
+  }
+  logSuccess('Later retries stay within the configured bounds');
+
+  const clientError = Object.assign(new Error('bad request'), { status: 400 });
+  if (client.computeRetryDelay(2, clientError) !== maxRetryDelay) {
+    throw new Error('Non-retryable errors should wait the maximum delay');
+  }
+  logSuccess('Client errors are parked at the maximum delay');
+
+  await client.close();
+}
+
+// Test 2: Resume after an interrupted upload (run once per chunk size, on the
+// same server)
+async function testResumeCapability(chunkSize) {
+  logTest(`Resume Capability (${chunkSize}-byte chunks)`);
+
+  const testFile = path.join(WORK_DIR, `test-resume-${chunkSize}.bin`);
+  const content = RESUME_PAYLOAD;
+  const totalChunks = Math.ceil(content.length / chunkSize);
+  fs.writeFileSync(testFile, content);
+
+  logInfo(`Uploading the first 3 of ${totalChunks} chunks concurrently...`);
+  // Each chunk carries its offset, so they may complete in any order. Size
+  // and digest are sent with every chunk, as the client does.
+  const sizeHeaders = { 'X-File-Size': content.length, 'X-Chunk-Size': chunkSize, 'X-File-SHA256': sha256(content) };
+  const file = { size: content.length, sha256: sha256(content) };
+  const responses = await Promise.all([0, 1, 2].map((i) =>
+    sendChunk(testFile, i, totalChunks, content.subarray(i * chunkSize, (i + 1) * chunkSize), sizeHeaders)));
+  const actualFilename = responses[0].body.actualFilename;
+  if (responses.some((response) => response.body.actualFilename !== actualFilename)) {
+    throw new Error(`Concurrent chunks went to different files: ${responses.map((r) => r.body.actualFilename)}`);
+  }
+
+  // Chunks are written in place in the final file, sized on the first chunk;
+  // there is no later step that copies parts into it
+  const partial = fs.statSync(path.join(UPLOAD_DIR, actualFilename));
+  if (partial.size !== content.length) {
+    throw new Error(`Partial upload is ${partial.size} bytes, expected the final ${content.length}`);
+  }
+  logSuccess('Chunks land in place in a file sized up front');
+
+  const expected = new ChunkBitmap().addRange(0, 3);
+  const status = await getStatus(testFile, {}, file);
+  if (status.statusCode !== 200 || status.body.receivedChunks.join(',') !== '0,1,2') {
+    throw new Error(`Unexpected status: ${JSON.stringify(status.body)}`);
+  }
+  const rangeStatus = await getStatus(testFile, { 'Accept': 'application/vnd.indexcp.ranges+json' }, file);
+  if (!ChunkBitmap.fromRanges(rangeStatus.body.ranges).equals(expected)) {
+    throw new Error(`Unexpected ranges: ${JSON.stringify(rangeStatus.body.ranges)}`);
+  }
+  logSuccess('Status endpoint reports chunks 0-2');
+
+  const client = new IndexedCPClient({ apiKey: API_KEY, chunkSize });
+  const received = await client.getReceivedChunks(SERVER_URL, testFile, API_KEY,
+    { fileSize: content.length, chunkSize, fileSha256: sha256(content) });
+  if (!received.equals(expected)) {
+    throw new Error(`Client saw received chunks [${[...received]}]`);
+  }
+  logSuccess('Client reads received chunks from ranges');
+  client.receivedChunksCache.clear();
+
+  const records = await client.buildChunkRecords(testFile);
+  if (records.some((record) => record.data.buffer.byteLength !== record.data.length)) {
+    throw new Error('Chunk buffers share a larger ArrayBuffer');
+  }
+  logSuccess('Each chunk record owns exactly its bytes');
+
+  logInfo('Resuming with the full file...');
+  await client.addFile(testFile);
+  const result = await client.uploadBufferedFiles(SERVER_URL);
+  await client.close();
+
+  if (result[testFile] !== actualFilename) {
+    throw new Error(`Resumed into ${result[testFile]}, expected ${actualFilename}`);
+  }
+
+  await verifyUpload(actualFilename, content);
+  logSuccess('Resumed file matches original');
+
+  const after = await getStatus(testFile, {}, file);
+  if (after.body.receivedChunks.length !== 0) {
+    throw new Error('Server should stop tracking a completed upload');
+  }
+  logSuccess('Tracking cleared after completion');
+}
+
+// Test 3: Duplicate chunks are acknowledged but not written again
+async function testChunkDeduplication() {
+  logTest('Chunk Deduplication');
+
+  const fileName = 'dedup.txt';
+  const first = await sendChunk(fileName, 0, 2, Buffer.from('first-'));
+  const duplicate = await sendChunk(fileName, 0, 2, Buffer.from('first-'));
+
+  if (duplicate.statusCode !== 200 || !duplicate.body.alreadyReceived) {
+    throw new Error(`Duplicate not detected: ${JSON.stringify(duplicate.body)}`);
+  }
+  logSuccess('Duplicate chunk acknowledged with alreadyReceived');
+
+  if (JSON.stringify(duplicate.body.ranges) !== '[[0,1]]') {
+    throw new Error(`Duplicate reply should list received ranges, got ${JSON.stringify(duplicate.body.ranges)}`);
+  }
+  logSuccess('Duplicate reply lists the received ranges');
+
+  const expectContinue = { 'Expect': '100-continue' };
+  const early = await sendChunk(fileName, 0, 2, Buffer.from('first-'), expectContinue);
+  if (!early.body.alreadyReceived || early.continued) {
+    throw new Error(`Duplicate body was requested: ${JSON.stringify(early)}`);
+  }
+  logSuccess('Duplicate acknowledged before its body was sent');
+
+  const second = await sendChunk(fileName, 1, 2, Buffer.from('second'), expectContinue);
+  if (second.statusCode !== 200 || !second.continued) {
+    throw new Error(`New chunk was not accepted: ${JSON.stringify(second)}`);
+  }
+  const uploaded = fs.readFileSync(path.join(UPLOAD_DIR, first.body.actualFilename), 'utf-8');
+  if (uploaded !== 'first-second') {
+    throw new Error(`Unexpected content: ${uploaded}`);
+  }
+  logSuccess('Duplicate data was not appended');
+}
+
+// Test 4: A file whose data does not match X-File-SHA256 is rejected
+async function testChecksumVerification() {
+  logTest('Checksum Verification');
+
+  const fileName = 'checksum.txt';
+  const wrongDigest = sha256('something else');
+
+  const first = await sendChunk(fileName, 0, 2, Buffer.from('hello '), { 'X-File-SHA256': wrongDigest });
+  const last = await sendChunk(fileName, 1, 2, Buffer.from('world'), { 'X-File-SHA256': wrongDigest });
+
+  if (last.statusCode !== 409) {
+    throw new Error(`Expected 409 for a bad checksum, got ${last.statusCode}`);
+  }
+  logSuccess('Mismatched checksum rejected with 409');
+
+  if (fs.existsSync(path.join(UPLOAD_DIR, first.body.actualFilename))) {
+    throw new Error('File should be removed after a mismatch');
+  }
+  logSuccess('Mismatched file removed, so a retry starts over');
+
+  // Out of order, the finished file is hashed instead of the running hash
+  const positionalName = 'checksum-positional.txt';
+  const parts = [Buffer.from('0123456789'), Buffer.from('abcdefghij')];
+  const whole = Buffer.concat(parts);
+  const upload = async (digest) => {
+    const headers = { 'X-File-Size': whole.length, 'X-Chunk-Size': 10, 'X-File-SHA256': digest };
+    const second = await sendChunk(positionalName, 1, 2, parts[1], headers);
+    const firstPart = await sendChunk(positionalName, 0, 2, parts[0], headers);
+    return { second, firstPart };
+  };
+  const bad = await upload(wrongDigest);
+  const good = await upload(sha256(whole));
+  if (bad.firstPart.statusCode !== 409 || good.firstPart.statusCode !== 200) {
+    throw new Error(`Expected 409 then 200 out of order, got ${bad.firstPart.statusCode} and ${good.firstPart.statusCode}`);
+  }
+  await verifyUpload(good.second.body.actualFilename, whole);
+  logSuccess('Out-of-order uploads are verified against the finished file');
+
+  // An aborted chunk must not leave its partial bytes in the running hash
+  const content = Buffer.from('0123456789abcdefghij');
+  const abortedName = 'checksum-aborted.txt';
+  const sizeHeaders = { 'X-File-Size': content.length, 'X-Chunk-Size': 10, 'X-File-SHA256': sha256(content) };
+  await new Promise((resolve) => {
+    const req = http.request({
+      hostname: 'localhost',
+      port: TEST_PORT,
+      path: '/upload',
+      method: 'POST',
+      headers: {
+        'Content-Length': 10,
+        'X-File-Name': abortedName,
+        'X-Chunk-Index': 0,
+        'X-Total-Chunks': 2,
+        'Authorization': `Bearer ${API_KEY}`,
+        ...sizeHeaders
+      }
+    });
+    req.on('error', () => {});
+    req.write(content.subarray(0, 5));
+    setTimeout(() => {
+      req.destroy();
+      resolve();
+    }, 50);
+  });
+  const retried = await sendChunk(abortedName, 0, 2, content.subarray(0, 10), sizeHeaders);
+  const completed = await sendChunk(abortedName, 1, 2, content.subarray(10), sizeHeaders);
+  if (retried.statusCode !== 200 || completed.statusCode !== 200) {
+    throw new Error(`Retry after an aborted chunk got ${retried.statusCode}, then ${completed.statusCode}`);
+  }
+  await verifyUpload(completed.body.actualFilename, content);
+  logSuccess('Retried chunk verifies after an aborted first attempt');
+}
+
+// Test 5: Gzip-compressed chunks are stored decompressed
+async function testCompressedUpload() {
+  logTest('Compressed Upload');
+
+  const raw = await sendChunk('gzip-raw.txt', 0, 1, zlib.gzipSync('compressed chunk'), { 'Content-Encoding': 'gzip' });
+  const rawContent = fs.readFileSync(path.join(UPLOAD_DIR, raw.body.actualFilename), 'utf-8');
+  if (rawContent !== 'compressed chunk') {
+    throw new Error(`Unexpected content: ${rawContent}`);
+  }
+  logSuccess('Server decompresses gzip chunks');
+
+  // zstd needs zlib support, which only newer Node versions have
+  if (typeof zlib.zstdCompressSync === 'function') {
+    const zstd = await sendChunk('zstd.txt', 0, 1, zlib.zstdCompressSync('zstd chunk'), { 'Content-Encoding': 'zstd' });
+    const zstdContent = fs.readFileSync(path.join(UPLOAD_DIR, zstd.body.actualFilename), 'utf-8');
+    if (zstdContent !== 'zstd chunk') {
+      throw new Error(`Unexpected content: ${zstdContent}`);
+    }
+    logSuccess('Server decompresses zstd chunks');
+  }
+
+  const unsupported = await sendChunk('brotli.txt', 0, 1, Buffer.from('data'), { 'Content-Encoding': 'br' });
+  if (unsupported.statusCode !== 415) {
+    throw new Error(`Expected 415 for an unsupported encoding, got ${unsupported.statusCode}`);
+  }
+  logSuccess('Unsupported encodings rejected with 415');
+
+  const testFile = path.join(WORK_DIR, 'test-compressed.txt');
+  const content = COMPRESSIBLE_PAYLOAD;
+  fs.writeFileSync(testFile, content);
+
+  const client = new IndexedCPClient({ apiKey: API_KEY, chunkSize: CHUNK_SIZE, compression: true });
+  await client.addFile(testFile);
+  const result = await client.uploadBufferedFiles(SERVER_URL);
+  await client.close();
+
+  const capabilities = client.serverCapabilities.get(SERVER_URL);
+  if (!capabilities.gzip || capabilities.zstd !== (typeof zlib.zstdCompress === 'function')) {
+    throw new Error(`Client detected ${JSON.stringify(capabilities)}`);
+  }
+
+  await verifyUpload(result[testFile], content);
+  logSuccess('Client upload with compression matches original');
+}
+
+// Test 6: Chunks that carry their offset can arrive in any order
+async function testOutOfOrderChunks() {
+  logTest('Out-of-Order Chunks');
+
+  const fileName = 'positional.txt';
+  const parts = ['aaaa', 'bbbb', 'cc'];
+  const sizeHeaders = { 'X-File-Size': 10, 'X-Chunk-Size': 4 };
+
+  let actualFilename;
+  for (const index of [2, 0, 1]) {
+    const response = await sendChunk(fileName, index, parts.length, Buffer.from(parts[index]), sizeHeaders);
+    actualFilename = response.body.actualFilename;
+  }
+
+  const uploaded = fs.readFileSync(path.join(UPLOAD_DIR, actualFilename), 'utf-8');
+  if (uploaded !== 'aaaabbbbcc') {
+    throw new Error(`Unexpected content: ${uploaded}`);
+  }
+  logSuccess('Chunks written at their offsets');
+
+  const outside = await sendChunk('outside.txt', 5, 6, Buffer.from('xx'), sizeHeaders);
+  if (outside.statusCode !== 400) {
+    throw new Error(`Expected 400 for a chunk past the end of the file, got ${outside.statusCode}`);
+  }
+  logSuccess('Chunks past the end of the file rejected with 400');
+
+  const beyond = await sendChunk('beyond.txt', 3, 3, Buffer.from('xx'));
+  if (beyond.statusCode !== 400) {
+    throw new Error(`Expected 400 for a chunk index past X-Total-Chunks, got ${beyond.statusCode}`);
+  }
+  logSuccess('Chunk indexes past X-Total-Chunks rejected with 400');
+}
+
+// Test 7: Resume by chunk index when chunks vary in size
+async function testVariableSizeChunks() {
+  logTest('Variable-Size Chunks');
+
+  const content = VARIABLE_PAYLOAD;
+  const chunks = variableChunks(content);
+  const fileName = 'variable.bin';
+  const interruptedAt = Math.floor(chunks.length / 2);
+  let actualFilename;
+  for (let i = 0; i < interruptedAt; i++) {
+    actualFilename = (await sendChunk(fileName, i, chunks.length, chunks[i])).body.actualFilename;
+  }
+
+  const status = await getStatus(fileName, { 'Accept': 'application/vnd.indexcp.ranges+json' });
+  const missing = ChunkBitmap.fromRanges(status.body.ranges).missing(chunks.length);
+  if (missing.length !== chunks.length - interruptedAt || missing[0] !== interruptedAt) {
+    throw new Error(`Expected chunks ${interruptedAt}+ to be missing, got [${missing}]`);
+  }
+  for (const i of missing) {
+    await sendChunk(fileName, i, chunks.length, chunks[i]);
+  }
+
+  await verifyUpload(actualFilename, content);
+  logSuccess(`Resumed ${chunks.length} variable-size chunks after chunk ${interruptedAt} by chunk index`);
+}
+
+// Test 8: A client with a stale view of the upload catches up from a duplicate's reply
+async function testStaleClientResync() {
+  logTest('Stale Client Resync');
+
+  const testFile = path.join(WORK_DIR, 'test-stale.bin');
+  const content = RESUME_PAYLOAD;
+  fs.writeFileSync(testFile, content);
+
+  const sizeHeaders = { 'X-File-Size': content.length, 'X-Chunk-Size': CHUNK_SIZE, 'X-File-SHA256': sha256(content) };
+  for (let i = 0; i < 4; i++) {
+    await sendChunk(testFile, i, 5, content.subarray(i * CHUNK_SIZE, (i + 1) * CHUNK_SIZE), sizeHeaders);
+  }
+
+  const client = new IndexedCPClient({ apiKey: API_KEY, chunkSize: CHUNK_SIZE });
+  // As if the client had asked for status before those chunks arrived
+  client.receivedChunksCache.set(`${SERVER_URL}\n${testFile}`, new ChunkBitmap());
+  const sent = [];
+  const uploadChunk = client.uploadChunk.bind(client);
+  client.uploadChunk = (serverUrl, chunk, index, ...rest) => {
+    sent.push(index);
+    return uploadChunk(serverUrl, chunk, index, ...rest);
+  };
+
+  await client.addFile(testFile);
+  const result = await client.uploadBufferedFiles(SERVER_URL);
+  await client.close();
+
+  if (sent.join(',') !== '0,4') {
+    throw new Error(`Expected to send chunks 0 and 4, sent ${sent.join(',')}`);
+  }
+  logSuccess('Chunks 1-3 skipped after the duplicate reply for chunk 0');
+
+  await verifyUpload(result[testFile], content);
+  logSuccess('Upload completed with the right content');
+}
+
+// Test 9: A multi-chunk request must carry the bytes it claims
+async function testCoalescedChunkValidation() {
+  logTest('Coalesced Chunk Validation');
+
+  const fileName = 'coalesced-short.bin';
+  const sizeHeaders = { 'X-File-Size': 4000, 'X-Chunk-Size': 1000 };
+  const short = await sendChunk(fileName, 0, 4, Buffer.alloc(10, 1), { ...sizeHeaders, 'X-Chunk-Count': 4 });
+  if (short.statusCode !== 400) {
+    throw new Error(`Expected 400 for a short multi-chunk body, got ${short.statusCode}`);
+  }
+  const status = await getStatus(fileName, {}, { size: 4000 });
+  if (status.body.receivedChunks.length !== 0) {
+    throw new Error(`Short body marked chunks [${status.body.receivedChunks}] received`);
+  }
+  logSuccess('Short body rejected, no chunks marked received');
+
+  const unpositioned = await sendChunk('coalesced-append.bin', 0, 2, Buffer.alloc(10, 1), { 'X-Chunk-Count': 2 });
+  const oversized = await sendChunk(fileName, 0, 2 ** 30, Buffer.alloc(10, 1),
+    { 'X-File-Size': 2 ** 30, 'X-Chunk-Size': 1, 'X-Chunk-Count': 2 ** 30 });
+  if (unpositioned.statusCode !== 400 || oversized.statusCode !== 400) {
+    throw new Error(`Expected 400s, got ${unpositioned.statusCode} and ${oversized.statusCode}`);
+  }
+  logSuccess('X-Chunk-Count needs X-Chunk-Size and is capped by the request size limit');
+
+  // Bytes past a chunk's end must not reach the file, even in compressed form
+  const longFile = 'coalesced-long.bin';
+  const longHeaders = { 'X-File-Size': 2000, 'X-Chunk-Size': 1000 };
+  const second = await sendChunk(longFile, 1, 2, Buffer.alloc(1000, 2), longHeaders);
+  const long = await sendChunk(longFile, 0, 2, Buffer.alloc(3000, 1), longHeaders);
+  const expanding = await sendChunk(longFile, 0, 2, zlib.gzipSync(Buffer.alloc(3000, 1)),
+    { ...longHeaders, 'Content-Encoding': 'gzip' });
+  if (long.statusCode !== 400 || expanding.statusCode !== 400) {
+    throw new Error(`Expected 400s for long bodies, got ${long.statusCode} and ${expanding.statusCode}`);
+  }
+  const longOutput = path.join(UPLOAD_DIR, second.body.actualFilename);
+  const onDisk = fs.readFileSync(longOutput);
+  if (onDisk.length !== 2000 || onDisk[1000] !== 2 || onDisk[1999] !== 2) {
+    throw new Error('A long body overwrote the next chunk or grew the file');
+  }
+  await sendChunk(longFile, 0, 2, Buffer.alloc(1000, 1), longHeaders);
+  await verifyUpload(second.body.actualFilename, Buffer.concat([Buffer.alloc(1000, 1), Buffer.alloc(1000, 2)]));
+  logSuccess('Long and over-expanding bodies rejected without touching the next chunk');
+
+  const unsized = await sendChunk('coalesced-unsized.bin', 0, 1, zlib.gzipSync(Buffer.alloc(17 * 1024 * 1024)),
+    { 'Content-Encoding': 'gzip' });
+  if (unsized.statusCode !== 413) {
+    throw new Error(`Expected 413 for an unsized body over the request size limit, got ${unsized.statusCode}`);
+  }
+  logSuccess('Unsized bodies are capped at the request size limit');
+}
+
+// Test 10: Clients cannot make the server track arbitrarily large or stale uploads
+async function testUploadTrackingBounds(server) {
+  logTest('Upload Tracking Bounds');
+
+  const huge = await sendChunk('huge-index.bin', 2 ** 31 - 2, 2 ** 31 - 1, Buffer.from('x'));
+  const inconsistent = await sendChunk('inconsistent.bin', 0, 1000, Buffer.alloc(10),
+    { 'X-File-Size': 20, 'X-Chunk-Size': 10 });
+  if (huge.statusCode !== 400 || inconsistent.statusCode !== 400) {
+    throw new Error(`Expected 400s, got ${huge.statusCode} and ${inconsistent.statusCode}`);
+  }
+  logSuccess('Oversized or inconsistent X-Total-Chunks rejected');
+
+  const fileName = 'abandoned.bin';
+  await sendChunk(fileName, 0, 3, Buffer.alloc(10), { 'X-File-Size': 30, 'X-Chunk-Size': 10 });
+  server.sweepIdleUploads();
+  if ((await getStatus(fileName, {}, { size: 30 })).body.receivedChunks.length !== 1) {
+    throw new Error('Active upload should survive the sweep');
+  }
+  server.sweepIdleUploads(Date.now() + server.uploadIdleTimeout);
+  if ((await getStatus(fileName, {}, { size: 30 })).body.receivedChunks.length !== 0) {
+    throw new Error('Idle upload should have been dropped');
+  }
+  logSuccess('Idle partial uploads are dropped by the sweep');
+}
+
+// Test 11: Chunks are only coalesced into one request when the server writes
+// them at their offsets
+async function testCoalescingNeedsPositionalWrites() {
+  logTest('Coalescing Needs Positional Writes');
+
+  const upload = async (name, unsized) => {
+    const testFile = path.join(WORK_DIR, name);
+    fs.writeFileSync(testFile, RESUME_PAYLOAD);
+    const client = new IndexedCPClient({ apiKey: API_KEY, chunkSize: CHUNK_SIZE });
+    const counts = [];
+    const uploadChunk = client.uploadChunk.bind(client);
+    client.uploadChunk = (serverUrl, chunk, index, fileName, apiKey, options) => {
+      counts.push(options.chunkCount);
+      return uploadChunk(serverUrl, chunk, index, fileName, apiKey, options);
+    };
+    const records = await client.buildChunkRecords(testFile);
+    if (unsized) {
+      // As buffered before positional writes: the server appends these
+      records.forEach((record) => { delete record.fileSize; delete record.chunkSize; });
+    }
+    await client.addChunkRecords(await client.initDB(), records);
+    const result = await client.uploadBufferedFiles(SERVER_URL);
+    await client.close();
+    await verifyUpload(result[testFile], RESUME_PAYLOAD);
+    return counts;
+  };
+
+  const sized = await upload('test-coalesce-sized.bin', false);
+  if (sized[0] !== 1 || !sized.some((count) => count > 1)) {
+    throw new Error(`Expected a single first chunk, then coalesced runs; got ${sized}`);
+  }
+  logSuccess(`Positional upload coalesced after the first reply (${sized.join(', ')})`);
+
+  const appended = await upload('test-coalesce-appended.bin', true);
+  if (appended.some((count) => count > 1)) {
+    throw new Error(`Appended upload coalesced chunks: ${appended}`);
+  }
+  logSuccess('Appended upload sent one chunk per request');
+
+  // Records buffered with a larger chunk size than the uploading client's
+  const testFile = path.join(WORK_DIR, 'test-coalesce-buffered.bin');
+  const content = crypto.randomBytes(16 * 1024);
+  fs.writeFileSync(testFile, content);
+  const buffering = new IndexedCPClient({ apiKey: API_KEY, chunkSize: 1024 });
+  const records = await buffering.buildChunkRecords(testFile);
+  await buffering.close();
+  const client = new IndexedCPClient({ apiKey: API_KEY, chunkSize: 64, maxRequestSize: 2048, parallelism: 1 });
+  let largest = 0;
+  const uploadChunk = client.uploadChunk.bind(client);
+  client.uploadChunk = (serverUrl, chunk, index, fileName, apiKey, options) => {
+    largest = Math.max(largest, chunk.length);
+    return uploadChunk(serverUrl, chunk, index, fileName, apiKey, options);
+  };
+  await client.addChunkRecords(await client.initDB(), records);
+  const result = await client.uploadBufferedFiles(SERVER_URL);
+  await client.close();
+  await verifyUpload(result[testFile], content);
+  if (largest > 2048) {
+    throw new Error(`Sent a ${largest}-byte request, over the 2048-byte limit`);
+  }
+  logSuccess('Runs are sized from the chunk size the file was buffered with');
+}
+
+// Test 12: Once writes are positional, a file's chunks are sent concurrently
+async function testConcurrentChunkUploads() {
+  logTest('Concurrent Chunk Uploads');
+
+  const upload = async (name, unsized) => {
+    const testFile = path.join(WORK_DIR, name);
+    const content = crypto.randomBytes(CHUNK_SIZE * 32);
+    fs.writeFileSync(testFile, content);
+    const client = new IndexedCPClient({ apiKey: API_KEY, chunkSize: CHUNK_SIZE, parallelism: 4 });
+    let inFlight = 0;
+    let peak = 0;
+    const uploadChunk = client.uploadChunk.bind(client);
+    client.uploadChunk = async (...args) => {
+      peak = Math.max(peak, ++inFlight);
+      try {
+        // Slow enough for requests to overlap, fast enough that runs stay short
+        await new Promise((resolve) => setTimeout(resolve, 5));
+        return await uploadChunk(...args);
+      } finally {
+        inFlight--;
+      }
+    };
+    const records = await client.buildChunkRecords(testFile);
+    if (unsized) {
+      records.forEach((record) => { delete record.fileSize; delete record.chunkSize; });
+    }
+    const db = await client.initDB();
+    await client.addChunkRecords(db, records);
+    const result = await client.uploadBufferedFiles(SERVER_URL);
+    const left = (await db.getAll(client.storeName)).length;
+    await client.close();
+    if (left !== 0) {
+      throw new Error(`${left} chunk record(s) left in the buffer`);
+    }
+    await verifyUpload(result[testFile], content);
+    return peak;
+  };
+
+  const sized = await upload('test-concurrent-sized.bin', false);
+  if (sized < 2) {
+    throw new Error(`Expected overlapping chunk requests, peak was ${sized}`);
+  }
+  logSuccess(`Positional upload had up to ${sized} chunk requests in flight`);
+
+  const appended = await upload('test-concurrent-appended.bin', true);
+  if (appended !== 1) {
+    throw new Error(`Appended upload had ${appended} chunk requests in flight`);
+  }
+  logSuccess('Appended upload sent its chunks one at a time');
+
+  // Several files at once still hold at most `parallelism` runs
+  const client = new IndexedCPClient({ apiKey: API_KEY, chunkSize: CHUNK_SIZE, parallelism: 2 });
+  let inFlight = 0;
+  let peak = 0;
+  const uploadChunk = client.uploadChunk.bind(client);
+  client.uploadChunk = async (...args) => {
+    peak = Math.max(peak, ++inFlight);
+    try {
+      await new Promise((resolve) => setTimeout(resolve, 5));
+      return await uploadChunk(...args);
+    } finally {
+      inFlight--;
+    }
+  };
+  const files = [];
+  for (let i = 0; i < 3; i++) {
+    const testFile = path.join(WORK_DIR, `test-concurrent-files-${i}.bin`);
+    const content = crypto.randomBytes(CHUNK_SIZE * 16);
+    fs.writeFileSync(testFile, content);
+    await client.addFile(testFile);
+    files.push({ testFile, content });
+  }
+  const result = await client.uploadBufferedFiles(SERVER_URL);
+  await client.close();
+  for (const { testFile, content } of files) {
+    await verifyUpload(result[testFile], content);
+  }
+  if (peak > 2) {
+    throw new Error(`${peak} runs in flight across files with parallelism 2`);
+  }
+  logSuccess(`Runs across files bounded by parallelism (peak ${peak})`);
+}
+
+// Test 13: Once a duplicate reply shows its view is stale, a client lets the
+// server turn down chunks it already has
+async function testClientExpectContinue(server) {
+  logTest('Client Expect: 100-continue');
+
+  const testFile = path.join(WORK_DIR, 'test-expect.bin');
+  const content = RESUME_PAYLOAD;
+  fs.writeFileSync(testFile, content);
+
+  const sizeHeaders = { 'X-File-Size': content.length, 'X-Chunk-Size': CHUNK_SIZE, 'X-File-SHA256': sha256(content) };
+  for (const i of [0, 2]) {
+    await sendChunk(testFile, i, 5, content.subarray(i * CHUNK_SIZE, (i + 1) * CHUNK_SIZE), sizeHeaders);
+  }
+
+  const expected = [];
+  const continued = [];
+  const onCheckContinue = (req, res) => {
+    const index = Number(req.headers['x-chunk-index']);
+    expected.push(index);
+    const writeContinue = res.writeContinue.bind(res);
+    res.writeContinue = () => {
+      continued.push(index);
+      writeContinue();
+    };
+  };
+  server.server.prependListener('checkContinue', onCheckContinue);
+
+  try {
+    const client = new IndexedCPClient({ apiKey: API_KEY, chunkSize: CHUNK_SIZE });
+    // As if the client had asked for status before chunks 0 and 2 arrived
+    client.receivedChunksCache.set(`${SERVER_URL}\n${testFile}`, new ChunkBitmap());
+    // Chunk 3 arrives from elsewhere after the duplicate reply for chunk 0
+    const uploadChunk = client.uploadChunk.bind(client);
+    client.uploadChunk = async (serverUrl, chunk, index, ...rest) => {
+      const response = await uploadChunk(serverUrl, chunk, index, ...rest);
+      if (index === 0) {
+        await sendChunk(testFile, 3, 5, content.subarray(3 * CHUNK_SIZE, 4 * CHUNK_SIZE), sizeHeaders);
+      }
+      return response;
+    };
+    await client.addFile(testFile);
+    const result = await client.uploadBufferedFiles(SERVER_URL);
+    await client.close();
+    await verifyUpload(result[testFile], content);
+  } finally {
+    server.server.removeListener('checkContinue', onCheckContinue);
+  }
+
+  const sorted = (indexes) => [...indexes].sort((a, b) => a - b).join(',');
+  if (sorted(expected) !== '1,3,4') {
+    throw new Error(`Expected chunks 1, 3 and 4 to be sent with Expect, got ${sorted(expected)}`);
+  }
+  if (sorted(continued) !== '1,4') {
+    throw new Error(`Expected bodies for chunks 1 and 4 only, got ${sorted(continued)}`);
+  }
+  logSuccess('Expect sent only after the duplicate reply; the later duplicate\'s body was never requested');
+}
+
+// Test 14: Different files uploaded under the same name are tracked apart
+async function testSameNameDifferentFiles() {
+  logTest('Same Name, Different Files');
+
+  const fileName = 'shared-name.bin';
+  const contents = [Buffer.alloc(20, 'a'), Buffer.alloc(20, 'b'), Buffer.alloc(30, 'c')];
+  const headers = contents.map((content) => ({
+    'X-File-Size': content.length, 'X-Chunk-Size': 10, 'X-File-SHA256': sha256(content)
+  }));
+
+  const firsts = [];
+  for (const [i, content] of contents.entries()) {
+    firsts.push(await sendChunk(fileName, 0, content.length / 10, content.subarray(0, 10), headers[i]));
+  }
+  if (firsts.some((first) => first.statusCode !== 200 || first.body.alreadyReceived)) {
+    throw new Error(`A chunk of one file counted for another: ${JSON.stringify(firsts.map((f) => f.body))}`);
+  }
+  if (new Set(firsts.map((first) => first.body.actualFilename)).size !== contents.length) {
+    throw new Error('Files with the same name share an output file');
+  }
+  logSuccess('Same-named files with a different digest or size get their own tracking');
+
+  for (const [i, content] of contents.entries()) {
+    for (let index = 1; index < content.length / 10; index++) {
+      await sendChunk(fileName, index, content.length / 10, content.subarray(index * 10, (index + 1) * 10), headers[i]);
+    }
+    await verifyUpload(firsts[i].body.actualFilename, content);
+  }
+  logSuccess('Each upload completed with its own content');
+}
+
+// Main test runner
+async function runAllTests() {
+  log('\n' + '═'.repeat(60), 'yellow');
+  log('IndexedCP - Resumable Upload Tests', 'yellow');
+  log('═'.repeat(60) + '\n', 'yellow');
+
+  let server;
+  const testResults = { passed: 0, failed: 0, total: 0 };
+
+  try {
+    server = new IndexedCPServer({
+      port: TEST_PORT,
+      outputDir: UPLOAD_DIR,
+      apiKey: API_KEY,
+      pathMode: 'ignore'
+    });
+
+    await new Promise((resolve) => {
+      server.listen(TEST_PORT, () => {
+        logSuccess(`Server started on port ${TEST_PORT}`);
+        resolve();
+      });
+    });
+
+    const tests = [
+      { name: 'Retry Mechanism', fn: testRetryMechanism },
+      ...RESUME_CHUNK_SIZES.map((chunkSize) => ({
+        name: `Resume Capability (${chunkSize}-byte chunks)`,
+        fn: () => testResumeCapability(chunkSize)
+      })),
+      { name: 'Chunk Deduplication', fn: testChunkDeduplication },
+      { name: 'Checksum Verification', fn: testChecksumVerification },
+      { name: 'Compressed Upload', fn: testCompressedUpload },
+      { name: 'Out-of-Order Chunks', fn: testOutOfOrderChunks },
+      { name: 'Variable-Size Chunks', fn: testVariableSizeChunks },
+      { name: 'Stale Client Resync', fn: testStaleClientResync },
+      { name: 'Coalesced Chunk Validation', fn: testCoalescedChunkValidation },
+      { name: 'Upload Tracking Bounds', fn: () => testUploadTrackingBounds(server) },
+      { name: 'Coalescing Needs Positional Writes', fn: testCoalescingNeedsPositionalWrites },
+      { name: 'Concurrent Chunk Uploads', fn: testConcurrentChunkUploads },
+      { name: 'Client Expect: 100-continue', fn: () => testClientExpectContinue(server) },
+      { name: 'Same Name, Different Files', fn: testSameNameDifferentFiles }
+    ];
+
+    for (const test of tests) {
+      testResults.total++;
+      try {
+        await test.fn();
+        testResults.passed++;
+        logSuccess(`Test passed: ${test.name}\n`);
+      } catch (error) {
+        testResults.failed++;
+        logError(`Test failed: ${test.name}`);
+        logError(`Error: ${error.message}\n`);
+      }
+    }
+  } catch (error) {
+    logError('Fatal error during test execution:');
+    console.error(error);
+    testResults.failed++;
+  } finally {
+    agent.destroy();
+    if (server) {
+      await server.close();
+    }
+    cleanup();
+
+    console.log('\n' + '═'.repeat(60));
+    log('Test Summary', 'yellow');
+    console.log('═'.repeat(60));
+    log(`Total Tests: ${testResults.total}`, 'blue');
+    log(`Passed: ${testResults.passed}`, 'green');
+    log(`Failed: ${testResults.failed}`, testResults.failed > 0 ? 'red' : 'green');
+    console.log('═'.repeat(60) + '\n');
+
+    process.exit(testResults.failed > 0 ? 1 : 0);
+  }
+}
+
+if (require.main === module) {
+  runAllTests().catch(error => {
+    logError('Unhandled error:');
+    console.error(error);
+    process.exit(1);
+  });
+}
+
+module.exports = { runAllTests };